@@ -0,0 +1,175 @@
+import os
+import time
+import sqlite3
+import threading
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+
+class ResponseCache:
+    """
+    On-disk cache of downloaded pages, keyed by url
+
+    Since IMDB's pagination key is part of the url of each 'load more' page,
+    review pages, pagination pages and search pages can all be cached by url.
+    The status and headers are stored with the body, such that a page that was
+    cached before it was decompressed can be rebuilt as it was downloaded.
+
+    Pages are stored in a single SQLite file. Pages older than ttl are treated as
+    missing. The total size of the pages is tracked while caching and, once it
+    exceeds max_size, expired and then the least recently used pages are evicted.
+
+    Parameters:
+    -----------
+    path : str
+        The location of the cache file, e.g., data/cache.sqlite
+
+    ttl : float, default None
+        The number of seconds a page stays valid. If None, pages never expire.
+
+    max_size : int, default 1GB
+        The maximum total size of all cached pages in bytes
+
+    Usage:
+    ------
+    To run the scraper offline, populate the cache with saved pages:
+
+    cache = ResponseCache("data/cache.sqlite")
+    cache.add_file("https://www.imdb.com/title/tt0103639/reviews", "fixtures/aladdin.html")
+    """
+    def __init__(self, path: str, ttl: float = None, max_size: int = 1024 ** 3):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+
+        # Caches without status and headers cannot rebuild compressed pages, so they are started over
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(pages)")]
+        if columns and "headers" not in columns:
+            self.connection.execute("DROP TABLE pages")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS pages "
+                                "(url TEXT PRIMARY KEY, body BLOB, size INTEGER, stored REAL, accessed REAL, "
+                                "status INTEGER, headers BLOB)")
+        self.connection.commit()
+
+        self.total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def get(self, url: str) -> bytes:
+        """ The cached body of url or None if it is not cached or expired """
+        page = self.get_page(url)
+        return page[2] if page is not None else None
+
+    def get_page(self, url: str) -> (int, bytes, bytes):
+        """ The cached status, raw headers and body of url or None if it is not cached or expired """
+        with self.lock:
+            row = self.connection.execute("SELECT status, headers, body, stored FROM pages WHERE url = ?",
+                                          (url,)).fetchone()
+
+            if row is None or (self.ttl is not None and time.time() - row[3] > self.ttl):
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.connection.execute("UPDATE pages SET accessed = ? WHERE url = ?", (time.time(), url))
+            self.connection.commit()
+            return row[0], row[1], row[2]
+
+    def set(self, url: str, body: bytes, status: int = 200, headers: bytes = b""):
+        """ Cache the body, status and raw headers of url and evict old pages if the cache is too large """
+        now = time.time()
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM pages WHERE url = ?", (url,)).fetchone()
+            self.connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (url, sqlite3.Binary(body), len(body), now, now,
+                                     status, sqlite3.Binary(headers)))
+            self.total += len(body) - (previous[0] if previous else 0)
+            if self.total > self.max_size:
+                self._evict()
+            self.connection.commit()
+
+    def add_file(self, url: str, path: str):
+        """ Cache a saved page, e.g., a fixture, as the body of url """
+        with open(path, "rb") as f:
+            self.set(url, f.read())
+
+    def size(self) -> int:
+        """ The total size of all cached pages in bytes """
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def _evict(self):
+        """ Remove expired pages, then the least recently used pages until the cache fits max_size """
+        if self.ttl is not None:
+            self.connection.execute("DELETE FROM pages WHERE stored < ?", (time.time() - self.ttl,))
+
+        # Count the size in the file, which includes pages added by other processes
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        self.total = total
+        if total <= self.max_size:
+            return
+
+        to_delete = []
+        for url, size in self.connection.execute("SELECT url, size FROM pages ORDER BY accessed"):
+            if total <= self.max_size:
+                break
+            to_delete.append((url,))
+            total -= size
+        self.connection.executemany("DELETE FROM pages WHERE url = ?", to_delete)
+        self.total = total
+
+
+class CacheMiddleware:
+    """
+    Scrapy downloader middleware that serves pages from a ResponseCache
+
+    Like Scrapy's HttpCacheMiddleware, it runs before HttpCompressionMiddleware and
+    stores pages as they were received, together with their status and headers. A cached
+    page is rebuilt with its original headers, e.g., Content-Encoding, such that it is
+    decompressed by HttpCompressionMiddleware just like a downloaded page.
+
+    Enabled through the settings of a crawler:
+
+    "DOWNLOADER_MIDDLEWARES": {"Reviewer.cache.CacheMiddleware": 900},
+    "REVIEWER_CACHE_PATH": "data/cache.sqlite",
+    "REVIEWER_CACHE_TTL": None,
+    "REVIEWER_CACHE_MAX_SIZE": 1024 ** 3,
+    """
+    def __init__(self, cache: ResponseCache):
+        self.cache = cache
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = settings.get("REVIEWER_CACHE_PATH")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        ttl = settings.get("REVIEWER_CACHE_TTL")
+        max_size = settings.getint("REVIEWER_CACHE_MAX_SIZE", 1024 ** 3)
+        return cls(ResponseCache(path, ttl=float(ttl) if ttl is not None else None, max_size=max_size))
+
+    def process_request(self, request, spider):
+        page = self.cache.get_page(request.url)
+        if page is None:
+            return None
+
+        status, raw_headers, body = page
+        headers = Headers(headers_raw_to_dict(raw_headers))
+        response_class = responsetypes.from_args(headers=headers, url=request.url, body=body)
+        return response_class(url=request.url, status=status, headers=headers, body=body,
+                              request=request, flags=["cached"])
+
+    def process_response(self, request, response, spider):
+        if response.status == 200 and "cached" not in response.flags:
+            self.cache.set(request.url, response.body, status=response.status,
+                           headers=headers_dict_to_raw(response.headers))
+        return response
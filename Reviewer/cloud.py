@@ -8,6 +8,7 @@ import colorsys
 
 from wordcloud import WordCloud, ImageColorGenerator
 from Reviewer.utils import MovieNotFoundError
+from Reviewer.index import TFIDFIndex
 
 
 class WordCloudGenerator:
@@ -78,7 +79,8 @@ class WordCloudGenerator:
                 TF-IDF-Relative
 
         movie : str
-            The movie to be used
+            The movie to be used. If data/disney_index exists (see TFIDF.save_index),
+            the TF-IDF words are read from that index instead of the json file.
 
         Returns:
         --------
@@ -87,6 +89,9 @@ class WordCloudGenerator:
             the importance of each word.
         """
 
+        if tfidf_type == "TF-IDF" and os.path.isdir(f'{self.dir_path}data/disney_index'):
+            return TFIDFIndex(f'{self.dir_path}data/disney_index').top_words(movie, k=2000)
+
         if tfidf_type == "TF-IDF":
             with open(f'{self.dir_path}data/disney_tfidf.json') as f:
                 disney = json.load(f)
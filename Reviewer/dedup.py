@@ -0,0 +1,146 @@
+import re
+import zlib
+import hashlib
+import numpy as np
+from collections import defaultdict
+
+from Reviewer.store import ReviewStore
+
+
+class ReviewDeduplicator:
+    """
+    Remove duplicate and near-duplicate reviews of a movie
+
+    Exact duplicates are found by hashing the normalized text (lowercase, single
+    whitespace) of each review. Near-duplicates, for example a review that was
+    edited slightly between two scrapes, are found with MinHash signatures over
+    word shingles and Locality-Sensitive Hashing: signatures are split in bands and
+    only reviews that share a band are compared. Of each group of duplicates,
+    the first review is kept.
+
+    Parameters:
+    -----------
+    threshold : float, default = 0.8
+        The minimum estimated Jaccard similarity of two near-duplicates
+
+    num_perm : int, default = 64
+        The number of hash functions of each MinHash signature
+
+    bands : int, default = 16
+        The number of LSH bands, num_perm should be a multiple of bands
+
+    shingle_size : int, default = 5
+        The number of words per shingle
+
+    near_duplicates : bool, default = True
+        Whether to also remove near-duplicates or only exact duplicates
+
+    Usage:
+    ------
+    dedup = ReviewDeduplicator()
+    reviews, nr_dropped = dedup.deduplicate(reviews)
+    """
+    _prime = (1 << 31) - 1
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 5, near_duplicates: bool = True, seed: int = 42):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.near_duplicates = near_duplicates
+
+        random_state = np.random.RandomState(seed)
+        self.a = random_state.randint(1, self._prime, size=num_perm).astype(np.uint64)
+        self.b = random_state.randint(0, self._prime, size=num_perm).astype(np.uint64)
+
+    def deduplicate(self, reviews: list) -> (list, int):
+        """ Remove duplicate reviews of a single movie
+
+        Returns
+        -------
+        reviews, nr_dropped : (list, int)
+            The remaining reviews, in their original order, and the number of dropped reviews
+        """
+        normalized = [re.sub(r"\s+", " ", review).strip().lower() for review in reviews]
+
+        # Exact duplicates
+        seen = set()
+        keep = []
+        for index, text in enumerate(normalized):
+            digest = hashlib.sha1(text.encode("utf-8")).digest()
+            if digest not in seen:
+                seen.add(digest)
+                keep.append(index)
+
+        # Near-duplicates
+        if self.near_duplicates and len(keep) > 1:
+            signatures = np.array([self.signature(normalized[index]) for index in keep])
+            duplicates = self._near_duplicates(signatures)
+            keep = [index for position, index in enumerate(keep) if position not in duplicates]
+
+        return [reviews[index] for index in keep], len(reviews) - len(keep)
+
+    def deduplicate_all(self, reviews) -> (dict, dict):
+        """ Remove duplicate reviews of each movie in a title (key) and reviews (value) mapping
+
+        Returns
+        -------
+        reviews, report : (dict, dict)
+            The remaining reviews and the number of dropped reviews of each movie
+        """
+        result, report = {}, {}
+        for title in reviews:
+            result[title], report[title] = self.deduplicate(reviews[title])
+        return result, report
+
+    def deduplicate_store(self, store_path: str, save_path: str) -> dict:
+        """ Write a deduplicated copy of a ReviewStore one movie at a time
+
+        Returns
+        -------
+        report : dict
+            The number of dropped reviews of each movie
+        """
+        store = ReviewStore(store_path)
+        report = {}
+
+        def deduplicated():
+            for title in store:
+                reviews, report[title] = self.deduplicate(store[title])
+                yield title, reviews
+
+        ReviewStore.write(save_path, deduplicated())
+        store.close()
+        return report
+
+    def signature(self, text: str) -> np.ndarray:
+        """ The MinHash signature of the word shingles of a (normalized) text """
+        words = text.split(" ")
+        size = min(self.shingle_size, len(words))
+        shingles = {" ".join(words[index:index + size]) for index in range(len(words) - size + 1)}
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) & self._prime for shingle in shingles],
+                          dtype=np.uint64)
+        return ((np.outer(hashes, self.a) + self.b) % self._prime).min(axis=0)
+
+    def _near_duplicates(self, signatures: np.ndarray) -> set:
+        """ Positions of signatures that are near-duplicates of an earlier signature """
+        candidates = defaultdict(set)
+        for band in range(self.bands):
+            buckets = defaultdict(list)
+            band_signatures = signatures[:, band * self.rows:(band + 1) * self.rows]
+            for position, band_signature in enumerate(map(bytes, band_signatures)):
+                buckets[band_signature].append(position)
+            # Compare each review with the first review that shares its bucket
+            for positions in buckets.values():
+                for position in positions[1:]:
+                    candidates[position].add(positions[0])
+
+        duplicates = set()
+        for position in sorted(candidates):
+            for earlier in sorted(candidates[position]):
+                if np.mean(signatures[position] == signatures[earlier]) >= self.threshold:
+                    duplicates.add(position)
+                    break
+        return duplicates
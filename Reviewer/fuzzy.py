@@ -0,0 +1,78 @@
+import editdistance
+from collections import defaultdict
+from typing import Iterable, List, Tuple
+
+
+class EditDistanceIndex:
+    """
+    Index for finding all words within a small edit distance of a word
+
+    Words are bucketed by length and each word is split into max_distance + 1
+    segments. Since max_distance edits can change at most max_distance segments,
+    a word within that distance of a query contains one of its segments unchanged,
+    shifted by at most max_distance characters in the query. A search therefore only
+    computes the edit distance to words of a similar length that share such a segment
+    with the query, instead of to all words. Words shorter than max_distance + 1
+    characters cannot be split and are always compared.
+
+    Parameters:
+    -----------
+    words : iterable of str
+        The words to index, duplicates are ignored
+
+    max_distance : int, default = 2
+        The maximum edit distance of a search
+
+    Usage:
+    ------
+    index = EditDistanceIndex(["Elsa", "Anna", "Olaf"])
+    index.search("Elza")
+    """
+    def __init__(self, words: Iterable[str], max_distance: int = 2):
+        self.max_distance = max_distance
+        self.words = list(dict.fromkeys(words))
+        self.segments = defaultdict(list)
+        self.short = defaultdict(list)
+        self.partitions = {}
+
+        for word_id, word in enumerate(self.words):
+            length = len(word)
+            if length <= max_distance:
+                self.short[length].append(word_id)
+                continue
+            for segment, (start, size) in enumerate(self._partition(length)):
+                self.segments[(length, segment, word[start:start + size])].append(word_id)
+
+    def search(self, word: str) -> List[Tuple[str, int]]:
+        """ All (word, distance) pairs in the index within max_distance of word """
+        max_distance = self.max_distance
+        length = len(word)
+
+        candidates = set()
+        for other_length in range(max(0, length - max_distance), length + max_distance + 1):
+            if other_length <= max_distance:
+                candidates.update(self.short[other_length])
+                continue
+
+            for segment, (start, size) in enumerate(self._partition(other_length)):
+                for position in range(max(0, start - max_distance), min(length - size, start + max_distance) + 1):
+                    key = (other_length, segment, word[position:position + size])
+                    if key in self.segments:
+                        candidates.update(self.segments[key])
+
+        results = []
+        for word_id in candidates:
+            distance = editdistance.eval(word, self.words[word_id])
+            if distance <= max_distance:
+                results.append((self.words[word_id], distance))
+        return results
+
+    def _partition(self, length: int) -> List[Tuple[int, int]]:
+        """ The (start, size) of each of the max_distance + 1 segments of a word of a given length """
+        if length not in self.partitions:
+            nr_segments = self.max_distance + 1
+            size, remainder = divmod(length, nr_segments)
+            sizes = [size] * (nr_segments - remainder) + [size + 1] * remainder
+            starts = [sum(sizes[:segment]) for segment in range(nr_segments)]
+            self.partitions[length] = list(zip(starts, sizes))
+        return self.partitions[length]
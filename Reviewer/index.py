@@ -0,0 +1,161 @@
+import os
+import json
+import numpy as np
+import scipy.sparse as sp
+
+from Reviewer.utils import MovieNotFoundError
+
+
+class TFIDFIndex:
+    """
+    Binary, memory-mapped c-TF-IDF index of all movies
+
+    Instead of only the top n words per movie, the index holds the full sparse
+    score matrix of a SparseTFIDF together with its vocabulary and titles.
+    The scores are stored twice, once per movie (csc) and once per word (csr),
+    such that both "top words of a movie" and "scores of a word across
+    movies" only read the part of the index that they need.
+
+    The index is a directory with the following files:
+        * vocabulary.txt - one word per line
+        * titles.json - the titles of all movies
+        * {columns, rows}_{data, indices, indptr}.npy - the sparse scores
+        * idf.npy, norm.npy - the smoothing term of the scores
+        * idf_order.npy - the words sorted by decreasing idf
+
+    Parameters:
+    -----------
+    path : str
+        The directory of the index, e.g., data/disney_index
+
+    Usage:
+    ------
+    index = TFIDFIndex("data/disney_index")
+    index.top_words("Frozen", k=10)
+    index.top_movies("olaf", k=5)
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(os.path.join(path, "titles.json")) as f:
+            self.titles = json.load(f)
+        self.title_index = {title: index for index, title in enumerate(self.titles)}
+
+        self.columns = [self._load(f"columns_{name}") for name in ["data", "indices", "indptr"]]
+        self.rows = [self._load(f"rows_{name}") for name in ["data", "indices", "indptr"]]
+        self.idf = self._load("idf")
+        self.norm = self._load("norm")
+        self.idf_order = self._load("idf_order")
+
+        self._terms = None
+        self._vocabulary = None
+
+    @staticmethod
+    def save(path: str, c_tf_idf, terms: list, titles: list):
+        """ Save a SparseTFIDF, its words and the movie titles as an index
+
+        Parameters
+        ----------
+        path : str
+            The directory to save the index to
+
+        c_tf_idf : SparseTFIDF
+            The (words x movies) scores
+
+        terms : list
+            The words, in the order of the rows of c_tf_idf
+
+        titles : list
+            The movie titles, in the order of the columns of c_tf_idf
+        """
+        os.makedirs(path, exist_ok=True)
+
+        columns = sp.csc_matrix(c_tf_idf.matrix)
+        columns.sort_indices()
+        rows = columns.tocsr()
+        rows.sort_indices()
+
+        for name, matrix in [("columns", columns), ("rows", rows)]:
+            np.save(os.path.join(path, f"{name}_data.npy"), matrix.data)
+            np.save(os.path.join(path, f"{name}_indices.npy"), matrix.indices)
+            np.save(os.path.join(path, f"{name}_indptr.npy"), matrix.indptr)
+        np.save(os.path.join(path, "idf.npy"), c_tf_idf.idf)
+        np.save(os.path.join(path, "norm.npy"), c_tf_idf.norm)
+        np.save(os.path.join(path, "idf_order.npy"), np.argsort(-c_tf_idf.idf, kind="stable"))
+
+        with open(os.path.join(path, "vocabulary.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(terms))
+        with open(os.path.join(path, "titles.json"), "w") as f:
+            json.dump(list(titles), f)
+
+    @property
+    def terms(self) -> list:
+        """ All words of the index, only read from disk when needed """
+        if self._terms is None:
+            with open(os.path.join(self.path, "vocabulary.txt"), encoding="utf-8") as f:
+                self._terms = f.read().split("\n")
+        return self._terms
+
+    @property
+    def vocabulary(self) -> dict:
+        """ Word (key) and row in the index (value) """
+        if self._vocabulary is None:
+            self._vocabulary = {term: index for index, term in enumerate(self.terms)}
+        return self._vocabulary
+
+    def top_words(self, movie: str, k: int = 10) -> list:
+        """ The k words with the highest score for a movie
+
+        Only the words counted in the movie and the k words with the highest
+        idf, which score best among the words that were not counted, are scored.
+        """
+        column = self._movie_index(movie)
+        data, indices, indptr = self.columns
+        start, end = indptr[column], indptr[column + 1]
+        k = min(k, len(self.idf))
+
+        if self.idf[self.idf_order[k - 1]] < 0:
+            candidates = np.arange(len(self.idf))
+            values = self.idf * self.norm[column]
+            values[indices[start:end]] += data[start:end]
+        else:
+            counted = np.asarray(indices[start:end])
+            smoothed = self.idf_order[:k]
+            smoothed = smoothed[~np.isin(smoothed, counted)]
+            candidates = np.concatenate([counted, smoothed])
+            values = self.idf[candidates] * self.norm[column]
+            values[:len(counted)] += data[start:end]
+
+        order = np.argsort(-values, kind="stable")[:k]
+        return [(self.terms[candidates[index]], float(values[index])) for index in order]
+
+    def term_scores(self, term: str) -> dict:
+        """ The score of a word in each movie """
+        values = self._term_values(term)
+        return {title: float(value) for title, value in zip(self.titles, values)}
+
+    def top_movies(self, term: str, k: int = 10) -> list:
+        """ The k movies in which a word has the highest score """
+        values = self._term_values(term)
+        order = np.argsort(-values, kind="stable")[:k]
+        return [(self.titles[index], float(values[index])) for index in order]
+
+    def _term_values(self, term: str) -> np.ndarray:
+        """ Dense scores of a single word across all movies """
+        if term not in self.vocabulary:
+            raise KeyError(f"{term} is not part of the vocabulary of {self.path}")
+
+        row = self.vocabulary[term]
+        data, indices, indptr = self.rows
+        start, end = indptr[row], indptr[row + 1]
+        values = self.idf[row] * np.asarray(self.norm)
+        values[indices[start:end]] += data[start:end]
+        return values
+
+    def _movie_index(self, movie: str) -> int:
+        if movie not in self.title_index:
+            raise MovieNotFoundError(movie, self.titles)
+        return self.title_index[movie]
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
@@ -0,0 +1,112 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import List, Tuple
+
+
+class InferenceCache:
+    """
+    Persistent cache of the NER and sentiment predictions of sentences
+
+    Each sentence is keyed by the hash of its text together with the identity of the
+    models that predicted it (e.g., "ner-fast/sentiment-fast"), such that switching
+    models never returns predictions of another model. The value of a sentence is the
+    list of PER spans and, if there are any, the sentiment label and score.
+
+    The cache is a SQLite file that can be shared by several processes. If it holds
+    more than max_entries sentences, the least recently used ones are evicted. The number
+    of sentences is tracked while inserting and only counted in the file when the limit
+    is reached or, to include sentences added by other processes, every 100,000 inserts.
+
+    Parameters:
+    -----------
+    path : str
+        The location of the cache file, e.g., data/inference.sqlite
+
+    max_entries : int, default 10_000_000
+        The maximum number of cached sentences
+
+    Usage:
+    ------
+    cache = InferenceCache("data/inference.sqlite")
+    char = Character(fast=True, cache=cache)
+    char.predict("data/disney_reviews.json", "disney")
+    cache.stats()
+    """
+    _recount_interval = 100_000
+
+    def __init__(self, path: str, max_entries: int = 10_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sentences "
+                                "(key BLOB PRIMARY KEY, value TEXT, accessed REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS sentences_accessed ON sentences (accessed)")
+        self.connection.commit()
+
+        self.entries = self.connection.execute("SELECT COUNT(*) FROM sentences").fetchone()[0]
+        self.inserted = 0
+
+    @staticmethod
+    def key(text: str, model: str) -> bytes:
+        return hashlib.sha1(f"{model}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts: List[str], model: str) -> List[Tuple[List[str], float, str]]:
+        """ The cached (PER spans, sentiment score, sentiment value) of each text, None if missing """
+        keys = [self.key(text, model) for text in texts]
+        found = {}
+
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                query = f"SELECT key, value FROM sentences WHERE key IN ({','.join('?' * len(chunk))})"
+                found.update(self.connection.execute(query, chunk).fetchall())
+
+            self.connection.executemany("UPDATE sentences SET accessed = ? WHERE key = ?",
+                                        [(time.time(), key) for key in found])
+            self.connection.commit()
+
+        self.hits += sum(key in found for key in keys)
+        self.misses += sum(key not in found for key in keys)
+        return [tuple(json.loads(found[key])) if key in found else None for key in keys]
+
+    def set_many(self, texts: List[str], model: str, outputs: List[Tuple[List[str], float, str]]):
+        """ Cache the (PER spans, sentiment score, sentiment value) of each text """
+        now = time.time()
+        rows = [(self.key(text, model), json.dumps(output), now) for text, output in zip(texts, outputs)]
+
+        with self.lock:
+            # The predictions of a sentence never change, so existing sentences are kept
+            cursor = self.connection.executemany("INSERT OR IGNORE INTO sentences VALUES (?, ?, ?)", rows)
+            self.entries += cursor.rowcount
+            self.inserted += cursor.rowcount
+            if self.entries > self.max_entries or self.inserted >= self._recount_interval:
+                self._evict()
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        """ Number of hits, misses and cached sentences """
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM sentences").fetchone()[0]
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0, "entries": entries}
+
+    def close(self):
+        self.connection.close()
+
+    def _evict(self):
+        """ Count the cached sentences and remove the least recently used ones if there are more than max_entries """
+        self.entries = self.connection.execute("SELECT COUNT(*) FROM sentences").fetchone()[0]
+        self.inserted = 0
+        if self.entries > self.max_entries:
+            self.connection.execute("DELETE FROM sentences WHERE key IN "
+                                    "(SELECT key FROM sentences ORDER BY accessed LIMIT ?)",
+                                    (self.entries - self.max_entries,))
+            self.entries = self.max_entries
@@ -0,0 +1,131 @@
+import os
+import json
+import numpy as np
+from array import array
+from collections.abc import Mapping
+
+from Reviewer.utils import MovieNotFoundError
+
+
+class MentionStore(Mapping):
+    """
+    Compact binary store of the extracted names and their sentiment
+
+    Instead of repeating the text of each name and its label for every mention, as the
+    *_names.json files do, each unique name is stored once and a mention is a name id,
+    a score and a label. The arrays are memory-mapped, so opening a store does not parse
+    any mentions and the arrays can be aggregated directly (see Character.aggregate_names).
+
+    The store is a directory with the following files:
+        * spans.json - the unique names
+        * span_ids.npy - the name of each mention, int32
+        * scores.npy - the sentiment probability of each mention, float32
+        * labels.npy - the sentiment of each mention, 1 (POSITIVE), -1 (NEGATIVE) or 0 (other), int8
+        * sentence_ids.npy - optional, the sentence of each mention, -1 if unknown, int32
+        * titles.json - title (key) and [first mention, end] (value)
+
+    The store behaves like the dict of the *_names.json files: store[title] returns the
+    list of [name, score, label] of a movie. Note that scores are stored with float32 precision.
+
+    Parameters:
+    -----------
+    path : str
+        The directory of the store, e.g., data/disney_names.mentions
+
+    Usage:
+    ------
+    MentionStore.convert("data/disney_names.json", "data/disney_names.mentions")
+    store = MentionStore("data/disney_names.mentions")
+    mentions = store["Frozen"]
+    """
+    _labels = {"POSITIVE": 1, "NEGATIVE": -1}
+    _label_names = {1: "POSITIVE", -1: "NEGATIVE", 0: None}
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(os.path.join(path, "titles.json")) as f:
+            self.titles = json.load(f)
+        with open(os.path.join(path, "spans.json")) as f:
+            self.spans = json.load(f)
+
+        self.span_ids = np.load(os.path.join(path, "span_ids.npy"), mmap_mode="r")
+        self.scores = np.load(os.path.join(path, "scores.npy"), mmap_mode="r")
+        self.labels = np.load(os.path.join(path, "labels.npy"), mmap_mode="r")
+
+        sentence_ids_path = os.path.join(path, "sentence_ids.npy")
+        self.sentence_ids = np.load(sentence_ids_path, mmap_mode="r") if os.path.exists(sentence_ids_path) else None
+
+    def __getitem__(self, title: str) -> list:
+        if title not in self.titles:
+            raise MovieNotFoundError(title, list(self.titles))
+
+        start, end = self.titles[title]
+        return [[self.spans[span_id], score, self._label_names[label]] for span_id, score, label in
+                zip(self.span_ids[start:end].tolist(), self.scores[start:end].tolist(), self.labels[start:end].tolist())]
+
+    def __iter__(self):
+        return iter(self.titles)
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def count(self, title: str) -> int:
+        """ The number of mentions of a movie """
+        start, end = self.titles[title]
+        return end - start
+
+    def title_ids(self) -> np.ndarray:
+        """ The position of the title of each mention in the titles of the store """
+        counts = [end - start for start, end in self.titles.values()]
+        return np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+
+    @staticmethod
+    def write(path: str, names):
+        """ Create a store from a dict, or an iterable of (title, mentions) tuples
+
+        Each mention is a [name, score, label] list as in the *_names.json files,
+        optionally followed by the id of the sentence in which the name was found.
+        """
+        os.makedirs(path, exist_ok=True)
+        titles_path = os.path.join(path, "titles.json")
+        if os.path.exists(titles_path):
+            os.remove(titles_path)
+
+        items = names.items() if isinstance(names, Mapping) else names
+        spans = {}
+        span_ids, scores, labels, sentence_ids = array("i"), array("f"), array("b"), array("i")
+        titles = {}
+
+        for title, mentions in items:
+            start = len(span_ids)
+            for mention in mentions:
+                span_ids.append(spans.setdefault(mention[0], len(spans)))
+                scores.append(mention[1] if mention[1] is not None else np.nan)
+                labels.append(MentionStore._labels.get(mention[2], 0))
+                sentence_ids.append(mention[3] if len(mention) > 3 else -1)
+            titles[title] = [start, len(span_ids)]
+
+        with open(os.path.join(path, "spans.json"), "w") as f:
+            json.dump(list(spans), f)
+
+        np.save(os.path.join(path, "span_ids.npy"), np.frombuffer(span_ids, dtype=np.int32))
+        np.save(os.path.join(path, "scores.npy"), np.frombuffer(scores, dtype=np.float32))
+        np.save(os.path.join(path, "labels.npy"), np.frombuffer(labels, dtype=np.int8))
+
+        sentence_ids_path = os.path.join(path, "sentence_ids.npy")
+        if any(sentence_id != -1 for sentence_id in sentence_ids):
+            np.save(sentence_ids_path, np.frombuffer(sentence_ids, dtype=np.int32))
+        elif os.path.exists(sentence_ids_path):
+            os.remove(sentence_ids_path)
+
+        # Written last, a store without titles.json is incomplete
+        with open(titles_path, "w") as f:
+            json.dump(titles, f)
+
+    @staticmethod
+    def convert(json_path: str, store_path: str):
+        """ Migrate a *_names.json file to a store """
+        with open(json_path) as f:
+            names = json.load(f)
+        MentionStore.write(store_path, names)
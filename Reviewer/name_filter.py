@@ -0,0 +1,114 @@
+import os
+import re
+import json
+import numpy as np
+from collections import Counter
+from typing import List, Tuple
+
+from Reviewer.mentions import MentionStore
+
+
+class NameFilter:
+    """
+    Cheap pre-filter that skips sentences which cannot contain a person
+
+    The NER tagger only finds persons in sentences that have a capitalized word other
+    than the first word, unless the first word is itself a name. A sentence passes
+    the filter if it has at least min_tokens words and either:
+        * a capitalized word that is not the first word (except for "I", "I'm", etc.)
+        * a word that is in the gazetteer of known names, regardless of case
+
+    The gazetteer is optional and can be built from previous *_names.json output,
+    which also catches names at the start of a sentence and names written in lowercase.
+
+    Parameters:
+    -----------
+    min_tokens : int, default = 2
+        Sentences with fewer words are skipped
+
+    gazetteer : set of str, default None
+        Lowercase name words, e.g., {"elsa", "robin", "williams"}
+
+    Usage:
+    ------
+    name_filter = NameFilter.from_names(["data/disney_names.json"])
+    char = Character(fast=True, name_filter=name_filter)
+    """
+    _token_pattern = re.compile(r"[^\W\d_][\w'’-]*")
+    _non_names = {"I", "I'm", "I've", "I'd", "I'll", "I’m", "I’ve", "I’d", "I’ll", "OK"}
+
+    def __init__(self, min_tokens: int = 2, gazetteer: set = None):
+        self.min_tokens = min_tokens
+        self.gazetteer = gazetteer or set()
+
+    @classmethod
+    def from_names(cls, paths: List[str], min_count: int = 2, min_length: int = 3,
+                   min_tokens: int = 2) -> "NameFilter":
+        """ Create a filter with a gazetteer of all name words that were found
+        at least min_count times in one or more *_names.json files or MentionStore directories
+        """
+        counts = Counter()
+        for path in paths:
+            if os.path.isdir(path):
+                store = MentionStore(path)
+                mentions = zip(store.spans, np.bincount(store.span_ids, minlength=len(store.spans)).tolist())
+            else:
+                with open(path) as f:
+                    names = json.load(f)
+                mentions = Counter(result[0] for results in names.values() for result in results).items()
+
+            for name, count in mentions:
+                for word in cls._token_pattern.findall(name):
+                    if word[0].isupper() and len(word) >= min_length:
+                        counts[word.lower()] += count
+
+        gazetteer = {word for word, count in counts.items() if count >= min_count}
+        return cls(min_tokens=min_tokens, gazetteer=gazetteer)
+
+    def may_contain_name(self, text: str) -> bool:
+        """ Whether a sentence could contain a person and should be passed to the tagger """
+        tokens = self._token_pattern.findall(text)
+        if len(tokens) < self.min_tokens:
+            return False
+
+        for token in tokens[1:]:
+            if token[0].isupper() and token not in self._non_names:
+                return True
+
+        if self.gazetteer:
+            return any(token.lower() in self.gazetteer for token in tokens)
+
+        return False
+
+    def filter(self, texts: List[str]) -> List[int]:
+        """ The indices of the sentences that pass the filter """
+        return [index for index, text in enumerate(texts) if self.may_contain_name(text)]
+
+    def recall(self, texts: List[str], outputs: List[Tuple[List[str], float, str]]) -> dict:
+        """ Compare the filter with the predictions of the full tagger
+
+        Parameters
+        ----------
+        texts : list of str
+            The sentences
+
+        outputs : list of tuples
+            The (PER spans, sentiment score, sentiment value) of each sentence
+            predicted by the tagger without a filter, see Character._predict_sentences
+
+        Returns
+        -------
+        report : dict
+            * recall - fraction of PER spans in sentences that pass the filter
+            * sentence_recall - fraction of sentences with a PER span that pass the filter
+            * skipped - fraction of all sentences that are skipped
+        """
+        passed = [self.may_contain_name(text) for text in texts]
+        spans = [len(output[0]) for output in outputs]
+
+        nr_spans = sum(spans)
+        nr_sentences = sum(count > 0 for count in spans)
+        return {"recall": sum(count for count, keep in zip(spans, passed) if keep) / nr_spans if nr_spans else 1.0,
+                "sentence_recall": sum(count > 0 and keep for count, keep in zip(spans, passed)) / nr_sentences
+                if nr_sentences else 1.0,
+                "skipped": 1 - sum(passed) / len(texts) if texts else 0.0}
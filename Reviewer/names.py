@@ -1,23 +1,34 @@
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+import os
 import re
 import json
-import editdistance
+import itertools
+import multiprocessing
 import numpy as np
 import pandas as pd
 
 from unidecode import unidecode
 from tqdm import tqdm
-from typing import List, Tuple, Union
+from typing import Iterable, Iterator, List, Tuple, Union
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib.colors import TwoSlopeNorm
 
+import torch
 from flair.data import Sentence
 from flair.models import SequenceTagger, TextClassifier
 from nltk.tokenize import sent_tokenize
+from Reviewer.fuzzy import EditDistanceIndex
+from Reviewer.store import load_reviews
+from Reviewer.sentences import SentenceIndex
+from Reviewer.mentions import MentionStore
+from Reviewer.inference_cache import InferenceCache
+from Reviewer.name_filter import NameFilter
+from Reviewer.utils import terminate_last_line
 import nltk
 nltk.download('punkt')
 
@@ -44,8 +55,18 @@ class Character:
         The path of the cwd, keep empty if there are no
         files to be saved in a parent dir
 
+    cache : InferenceCache, default None
+        A persistent cache of sentence predictions. If given, only sentences
+        that were not predicted before by the same models are passed to the models.
+
+    name_filter : NameFilter, default None
+        If given, sentences that cannot contain a person according to the
+        filter are not passed to the models. See NameFilter.recall for the
+        fraction of persons that are kept.
+
     """
-    def __init__(self, load_classifiers=True, fast=False, dir_path: str = ""):
+    def __init__(self, load_classifiers=True, fast=False, dir_path: str = "", cache: InferenceCache = None,
+                 name_filter: NameFilter = None):
         if load_classifiers:
             if fast:
                 self.tagger = SequenceTagger.load('ner-fast')
@@ -54,14 +75,22 @@ class Character:
                 self.tagger = SequenceTagger.load('ner')
                 self.classifier = TextClassifier.load('sentiment')
 
+        self.fast = fast
+        self.model = "ner-fast/sentiment-fast" if fast else "ner/sentiment"
+        self.cache = cache
+        self.name_filter = name_filter
         self.dir_path = dir_path
         self.reviews_path = None
         self.reviews = None
+        self.sentence_index = None
         self.titles = None
         self.names = None
+        self.mentions = None
+        self.sentences_per_movie = None
         self.processed_names = None
 
-    def predict_single_movie(self, reviews: List[str]) -> List[Tuple[str, int, str]]:
+    def predict_single_movie(self, reviews: List[str], batch_size: int = None,
+                             sentences: Iterable[str] = None) -> List[Tuple[str, int, str]]:
         """ Create predictions for a single movie
 
         Parameters
@@ -69,6 +98,14 @@ class Character:
         reviews : list of str
             A list of reviews
 
+        batch_size : int, default None
+            If given, the sentences are streamed in length-bucketed mini-batches of this size
+            (see iter_predictions) instead of creating all sentences of the movie at once
+
+        sentences : iterable of str, default None
+            The sentences of the reviews, e.g., from a SentenceIndex. If given,
+            the reviews are not split into sentences again.
+
         Returns
         -------
         results : list of tuples
@@ -76,47 +113,156 @@ class Character:
             classified as "PER"
 
         """
-        new_docs = [sent_tokenize(doc) for doc in reviews]
-        new_docs = [x for sublist in new_docs for x in sublist]
-        new_docs = [Sentence(x) for x in new_docs]
+        if batch_size:
+            return [result for results in self.iter_predictions(reviews, batch_size, sentences=sentences)
+                    for result in results]
 
-        self.tagger.predict(new_docs, verbose=False)
-        self.classifier.predict(new_docs, verbose=False)
+        if sentences is None:
+            sentences = (sentence for doc in reviews for sentence in sent_tokenize(doc))
+        new_docs = list(sentences)
 
-        results = []
-        for sentence in new_docs:
-            for token in sentence.get_spans('ner'):
-                if token.tag == "PER":
-                    results.append((token.text, sentence.get_labels()[0].score, sentence.get_labels()[0].value))
+        outputs = self._predict_sentences(new_docs)
+        results = self._to_results(outputs)
 
         # with open(f'{self.dir_path}{name}.json', 'w') as f:
         #     json.dump(results, f)
 
         return results
 
+    def iter_predictions(self, reviews: Iterable[str], batch_size: int = 32, buffer_batches: int = 8,
+                         sentences: Iterable[str] = None) -> Iterator[List[Tuple[str, int, str]]]:
+        """ Stream the predictions of a single movie
+
+        Sentences are created lazily from the reviews and collected in a buffer of
+        batch_size * buffer_batches sentences. The buffer is sorted by length such that each
+        mini-batch contains sentences of similar length, which reduces padding. Memory is
+        therefore bounded by the buffer instead of by the number of reviews of the movie.
+
+        Parameters
+        ----------
+        reviews : iterable of str
+            The reviews of a movie, e.g., ReviewStore.iter_reviews(title)
+
+        batch_size : int, default 32
+            The number of sentences per mini-batch
+
+        buffer_batches : int, default 8
+            The number of mini-batches that are sorted by length together
+
+        sentences : iterable of str, default None
+            The sentences of the reviews, e.g., from a SentenceIndex. If given,
+            the reviews are not split into sentences again.
+
+        Yields
+        ------
+        results : list of tuples
+            The results of each buffer, in the same format and order as predict_single_movie
+        """
+        if sentences is None:
+            sentences = (sentence for doc in reviews for sentence in sent_tokenize(doc))
+        sentences = iter(sentences)
+
+        while True:
+            buffer = list(itertools.islice(sentences, batch_size * buffer_batches))
+            if not buffer:
+                return
+
+            order = sorted(range(len(buffer)), key=lambda index: len(buffer[index]))
+            outputs = [None] * len(buffer)
+            for start in range(0, len(order), batch_size):
+                indices = order[start:start + batch_size]
+                batch = self._predict_sentences([buffer[index] for index in indices], mini_batch_size=batch_size)
+                for index, output in zip(indices, batch):
+                    outputs[index] = output
+
+            yield self._to_results(outputs)
+
+    def _predict_sentences(self, texts: List[str], mini_batch_size: int = 32) -> List[Tuple[List[str], float, str]]:
+        """ Predict the PER spans and, if there are any, the sentiment score and value of each sentence
+
+        Sentences that are in the cache are not passed to the models and
+        the predictions of all other sentences are added to the cache. Sentences
+        that are rejected by the name filter are not passed to the models either.
+        """
+        outputs = self.cache.get_many(texts, self.model) if self.cache else [None] * len(texts)
+        missing = [index for index, output in enumerate(outputs) if output is None]
+
+        if self.name_filter:
+            candidates = set(self.name_filter.filter([texts[index] for index in missing]))
+            for position, index in enumerate(missing):
+                if position not in candidates:
+                    outputs[index] = ([], None, None)
+            missing = [index for position, index in enumerate(missing) if position in candidates]
+
+        if not missing:
+            return outputs
+
+        sentences = [Sentence(texts[index]) for index in missing]
+        self._tag_and_classify(sentences, mini_batch_size=mini_batch_size)
+
+        for index, sentence in zip(missing, sentences):
+            spans = [token.text for token in sentence.get_spans('ner') if token.tag == "PER"]
+            if spans:
+                outputs[index] = (spans, sentence.get_labels()[0].score, sentence.get_labels()[0].value)
+            else:
+                outputs[index] = (spans, None, None)
+
+        if self.cache:
+            self.cache.set_many([texts[index] for index in missing], self.model,
+                                [outputs[index] for index in missing])
+
+        return outputs
+
+    def _tag_and_classify(self, sentences: List[Sentence], mini_batch_size: int = 32):
+        """ Tag all sentences and classify the sentiment of those in which a person was found """
+        self.tagger.predict(sentences, mini_batch_size=mini_batch_size, verbose=False)
+
+        # Only sentences in which a person was found need a sentiment
+        sentences = [sentence for sentence in sentences
+                     if any(token.tag == "PER" for token in sentence.get_spans('ner'))]
+        if sentences:
+            self.classifier.predict(sentences, mini_batch_size=mini_batch_size, verbose=False)
+
+    @staticmethod
+    def _to_results(outputs: List[Tuple[List[str], float, str]]) -> List[Tuple[str, int, str]]:
+        """ Extract the text, sentiment score and sentiment value of each person """
+        results = []
+        for spans, score, value in outputs:
+            for span in spans:
+                results.append((span, score, value))
+        return results
+
     def load_reviews(self, reviews_path: str, names_path: str = None):
         """ Load reviews and the corresponding titles
 
         Parameters
         ----------
         reviews_path : str
-            The path of the review location.
-            E.g. : disney_reviews.json
+            The path of the review location, either a json file or a ReviewStore directory.
+            E.g. : disney_reviews.json or disney_reviews.store
 
         names_path : str, default None
-            Whether to also extract the names if they were previously extracted
+            Whether to also extract the names if they were previously extracted,
+            either a json file or a MentionStore directory.
+            E.g. : disney_names.json or disney_names.mentions
         """
         if reviews_path:
             self.reviews_path = reviews_path
-            with open(f'{self.dir_path}{self.reviews_path}') as f:
-                self.reviews = json.load(f)
+            self.reviews = load_reviews(f'{self.dir_path}{self.reviews_path}')
+            self.sentence_index = SentenceIndex.open_or_build(
+                f'{self.dir_path}{SentenceIndex.default_path(self.reviews_path)}',
+                f'{self.dir_path}{self.reviews_path}', self.reviews)
             self.titles = [(title, re.sub('[^a-zA-Z]+', '', title).lower()) for title in list(self.reviews.keys())]
 
         if names_path:
-            with open(f'{self.dir_path}{names_path}') as f:
-                self.names = json.load(f)
+            if os.path.isdir(f'{self.dir_path}{names_path}'):
+                self.names = MentionStore(f'{self.dir_path}{names_path}')
+            else:
+                with open(f'{self.dir_path}{names_path}') as f:
+                    self.names = json.load(f)
 
-    def predict(self, path: str, prefix: str) -> dict:
+    def predict(self, path: str, prefix: str, batch_size: int = None, n_jobs: int = None,
+                chunk_size: int = 500, threads_per_job: int = 1, resume: bool = False) -> dict:
         """ For each movie in path, predict which words are persons and extract
         the sentiment of the sentence in which the person appears.
 
@@ -129,6 +275,30 @@ class Character:
         prefix : str
             Prefix for the file you want saved
 
+        batch_size : int, default None
+            If given, stream the sentences of each movie in mini-batches of this size
+
+        n_jobs : int, default None
+            If given, the movies are split in chunks of at most chunk_size reviews that are
+            handed out to n_jobs worker processes. Each worker loads the tagger and classifier
+            once. The models of this Character are not used, so it can be created with
+            load_classifiers=False.
+
+        chunk_size : int, default 500
+            The maximum number of reviews per task when n_jobs is given
+
+        threads_per_job : int, default 1
+            The number of torch threads of each worker, keep n_jobs * threads_per_job
+            at or below the number of cores to prevent oversubscription
+
+        resume : bool, default False
+            The results of each movie are appended to data/{prefix}_names.jsonl as soon as
+            the movie is done. If True, movies that are already in that file, e.g., from a
+            run that crashed, are skipped. Otherwise the file is started over.
+
+        The results are saved to data/{prefix}_names.json and, as a MentionStore,
+        to data/{prefix}_names.mentions.
+
         Returns
         -------
         to_save : dict
@@ -136,22 +306,89 @@ class Character:
         """
         self.load_reviews(path)
 
+        log_path = f'{self.dir_path}data/{prefix}_names.jsonl'
+        if not resume and os.path.exists(log_path):
+            os.remove(log_path)
+        log = PredictionLog(log_path)
+        titles = [title for title, _ in self.titles if title not in log]
+
         # Generate predictions
-        results = {title: None for title in self.titles}
-        for title, name in tqdm(self.titles):
-            results[title] = self.predict_single_movie(self.reviews[title])
+        if n_jobs:
+            self._predict_parallel(titles, log, n_jobs, chunk_size, threads_per_job, batch_size)
+        else:
+            for title in tqdm(titles):
+                reviews = self.reviews[title]
+                log.record(title, self.predict_single_movie(reviews, batch_size=batch_size,
+                                                            sentences=self.sentence_index.sentences(title, reviews)))
 
         # Save results - make sure correct format is used
-        self.names = {title: results[title] for title, _ in self.titles}
+        titles = [title for title, _ in self.titles]
+        log.finalize(f'{self.dir_path}data/{prefix}_names.json', titles)
+        MentionStore.write(f'{self.dir_path}data/{prefix}_names.mentions',
+                           ((title, log.results(title)) for title in titles if title in log))
 
-        with open(f'{self.dir_path}data/{prefix}_names.json', 'w') as f:
-            json.dump(self.names, f)
+        with open(f'{self.dir_path}data/{prefix}_names.json') as f:
+            self.names = json.load(f)
 
         return self.names
 
-    def preprocess_names_and_reviews(self, reviews_path: str = None, names_path: str = None):
+    def _predict_parallel(self, titles: List[str], log: "PredictionLog", n_jobs: int, chunk_size: int,
+                          threads_per_job: int, batch_size: int = None):
+        """ Predict movies with a pool of worker processes and log each movie once all its chunks are done
+
+        Chunks are created lazily, one movie at a time, and at most 2 * n_jobs chunks are
+        in flight, such that memory does not grow with the size of the corpus.
+        """
+        nr_chunks = {}
+        tasks = self._chunk_tasks(titles, chunk_size, batch_size, nr_chunks)
+
+        chunks = {title: {} for title in titles}
+        context = multiprocessing.get_context("spawn")
+        cache = (self.cache.path, self.cache.max_entries) if self.cache else None
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.fast, threads_per_job, cache, self.name_filter)) as executor, \
+                tqdm(total=len(titles)) as progress:
+            pending = set()
+            while True:
+                for task in itertools.islice(tasks, 2 * n_jobs - len(pending)):
+                    pending.add(executor.submit(_predict_chunk, task))
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    title, index, results, (hits, misses) = future.result()
+                    chunks[title][index] = results
+                    if self.cache:
+                        self.cache.hits += hits
+                        self.cache.misses += misses
+
+                    if len(chunks[title]) == nr_chunks[title]:
+                        movie = chunks.pop(title)
+                        log.record(title, [result for index in sorted(movie) for result in movie[index]])
+                        progress.update()
+
+    def _chunk_tasks(self, titles: List[str], chunk_size: int, batch_size: int,
+                     nr_chunks: dict) -> Iterator[Tuple[str, int, List[str], int]]:
+        """ Split the sentences of each movie into chunks of chunk_size reviews
+
+        Only the reviews of the current movie are loaded. The number of chunks of a movie
+        is stored in nr_chunks before its first chunk is yielded.
+        """
+        for title in titles:
+            reviews = list(self.reviews[title])
+            starts = range(0, max(len(reviews), 1), chunk_size)
+            nr_chunks[title] = len(starts)
+            for index, start in enumerate(starts):
+                sentences = list(self.sentence_index.sentences(title, reviews[start:start + chunk_size], start))
+                yield title, index, sentences, batch_size
+
+    def preprocess_names_and_reviews(self, reviews_path: str = None, names_path: str = None, threshold: float = 0.9):
         """ Preprocess reviews and combine similar names
 
+        The mentions of all movies are normalized once and kept, such that
+        aggregate_names can be used to try other thresholds.
+
         Parameters
         ----------
         reviews_path : str, default None
@@ -161,13 +398,33 @@ class Character:
         names_path : str, default None
             The path of the names json file. If None, then use the
             names already loaded within this class.
+
+        threshold : float, default 0.9
+            Only mentions of which the sentiment probability exceeds the threshold are used
         """
         self.load_reviews(reviews_path, names_path)
-        sentences_per_movie = {title: _get_nr_sentences(self.reviews[title]) for title in self.reviews}
-        self.processed_names = {title: _preprocess_names(self.names[title],
-                                                         sentences_per_movie[title],
-                                                         title) for
-                                title in self.names}
+        self.sentences_per_movie = {title: self.sentence_index.count(title) for title in self.reviews}
+        self.mentions = _collect_mentions(self.names)
+        self.aggregate_names(threshold)
+
+    def aggregate_names(self, threshold: float = 0.9) -> dict:
+        """ Combine similar names and average their sentiment for each movie
+
+        Uses the mentions that were normalized by preprocess_names_and_reviews,
+        so changing the threshold does not normalize the names again.
+
+        Parameters
+        ----------
+        threshold : float, default 0.9
+            Only mentions of which the sentiment probability exceeds the threshold are used
+
+        Returns
+        -------
+        processed_names : dict
+            Title (key) and dataframe of the names in that movie (value)
+        """
+        self.processed_names = _aggregate_names(self.mentions, self.sentences_per_movie, list(self.names), threshold)
+        return self.processed_names
 
     def visualize_names(self, name: str, people: bool = False, save: str = None):
         """ Visualize the most frequent names and their respective averaged sentiment
@@ -210,13 +467,101 @@ class Character:
             plt.show()
 
 
-def _get_nr_sentences(docs: List[str]) -> int:
-    """ Extract nr of sentences from a list of documents """
-    total_nr_sentences = 0
-    for doc in docs:
-        sentences = sent_tokenize(doc)
-        total_nr_sentences += len(sentences)
-    return total_nr_sentences
+class PredictionLog:
+    """
+    Append-only JSON Lines log of the predictions of each movie such that Character.predict can be resumed
+
+    Each line holds the title and results of a single movie and is written as soon as that
+    movie is done. A crash therefore loses at most the movies that were being predicted, and
+    a partially written last line is ignored. Only the position of each movie in the file is
+    kept in memory, the results are read back when the log is finalized.
+
+    Parameters:
+    -----------
+    path : str
+        The location of the log, e.g., data/disney_names.jsonl
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets = {}
+
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                start = 0
+                for line in f:
+                    try:
+                        movie = json.loads(line)
+                    except json.JSONDecodeError:
+                        start += len(line)
+                        continue
+                    self.offsets[movie["title"]] = (start, len(line))
+                    start += len(line)
+
+            terminate_last_line(path)
+
+    def __contains__(self, title: str) -> bool:
+        return title in self.offsets
+
+    def record(self, title: str, results: List[Tuple[str, float, str]]):
+        """ Append the results of a movie, a movie that is recorded twice keeps its last results """
+        line = (json.dumps({"title": title, "results": results}) + "\n").encode("utf-8")
+        with open(self.path, "ab") as f:
+            start = f.tell()
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.offsets[title] = (start, len(line))
+
+    def results(self, title: str) -> List[List[Union[str, float, str]]]:
+        """ The results of a recorded movie """
+        start, length = self.offsets[title]
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return json.loads(f.read(length))["results"]
+
+    def finalize(self, path: str, titles: List[str] = None):
+        """ Write the recorded movies as a *_names.json file with title (key) and results (value)
+
+        Movies are written one at a time in the order of titles, or in the
+        order in which they were recorded, to a temporary file that replaces path.
+        """
+        titles = titles if titles is not None else list(self.offsets)
+
+        with open(path + ".tmp", "w") as f:
+            f.write("{")
+            for index, title in enumerate(title for title in titles if title in self.offsets):
+                f.write((", " if index else "") + json.dumps(title) + ": " + json.dumps(self.results(title)))
+            f.write("}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+
+_worker_character = None
+
+
+def _init_worker(fast: bool, threads: int, cache: Tuple[str, int] = None, name_filter: NameFilter = None):
+    """ Load the models once per worker process of Character.predict """
+    global _worker_character
+    torch.set_num_threads(threads)
+    _worker_character = Character(fast=fast, cache=InferenceCache(*cache) if cache else None,
+                                  name_filter=name_filter)
+
+
+def _predict_chunk(task: Tuple[str, int, List[str], int]) -> Tuple[str, int, List[Tuple[str, int, str]],
+                                                                   Tuple[int, int]]:
+    """ Predict the sentences of a chunk of reviews of a movie in a worker process of Character.predict
+
+    Also returns the number of cache hits and misses of the chunk, since the
+    cache of the worker is not the cache of the Character in the main process.
+    """
+    title, index, sentences, batch_size = task
+    cache = _worker_character.cache
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    results = _worker_character.predict_single_movie([], batch_size=batch_size, sentences=sentences)
+    if cache:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    return title, index, results, (hits, misses)
 
 
 def _preprocess_names(names: List[List[Union[str, float, str]]], nr_sentences: int, title: str) -> pd.DataFrame:
@@ -245,29 +590,110 @@ def _preprocess_names(names: List[List[Union[str, float, str]]], nr_sentences: i
         The name of the movie to make sure the character is not in the name of the movie.
         The result would be a much higher count of the character as it should be.
     """
-    df = pd.DataFrame(names, columns=["Word", "Prob", "Sentiment"])
+    return _aggregate_names(_collect_mentions({title: names}), {title: nr_sentences}, [title])[title]
 
-    # Preprocessing - Only keep high probabilities and general cleaning
+
+def _collect_mentions(names: Union[dict, MentionStore]) -> pd.DataFrame:
+    """ Create a single dataframe of the mentions of all movies with normalized names
+
+    Parameters
+    ----------
+    names : dict or MentionStore
+        Title (key) and the list of names, their sentiment probability and sentiment (value),
+        see _preprocess_names
+
+    Returns
+    -------
+    df : pd.DataFrame
+        The columns "Word", "Prob", "Sentiment" and "Title" of each mention with a valid name
+    """
+    if isinstance(names, MentionStore):
+        return _collect_stored_mentions(names)
+
+    df = pd.DataFrame([mention for title in names for mention in names[title]],
+                      columns=["Word", "Prob", "Sentiment"])
+    df["Title"] = [title for title in names for _ in names[title]]
+
+    # Preprocessing - General cleaning
     df.Sentiment = df.Sentiment.map({"POSITIVE": 1, "NEGATIVE": -1})
-    df.Word = [unidecode(word) for word in df.Word]
-    df.Word = df.Word.str.replace('[^A-z]', ' ').str.strip()
-    df.Word = [re.sub(r"\b[a-zA-Z]\b", "", word).strip() for word in df.Word.values]
-    df = df.loc[df.Word != "Disney", :]
-    df = df.loc[df.Word.str.len() >= 3, :]
-    df = df.loc[df.Prob > 0.9, :]
-    df = _preprocess_titles(df)
+    df.Word = _normalize_names(df.Word)
+    df = df.loc[(df.Word != "Disney") & (df.Word.str.len() >= 3), :]
+
+    return df
+
+
+def _collect_stored_mentions(store: MentionStore) -> pd.DataFrame:
+    """ Create the dataframe of _collect_mentions straight from the arrays of a MentionStore
+
+    Each unique name of the store is normalized once and mapped to the mentions through their name ids.
+    """
+    words = _normalize_names(pd.Series(store.spans, dtype=object)).values
+    titles = np.array(list(store.titles), dtype=object)
+
+    df = pd.DataFrame({"Word": words[store.span_ids] if len(words) else np.array([], dtype=object),
+                       "Prob": np.asarray(store.scores),
+                       "Sentiment": np.asarray(store.labels).astype(np.int64),
+                       "Title": titles[store.title_ids()] if len(titles) else np.array([], dtype=object)})
+    df = df.loc[(df.Word != "Disney") & (df.Word.str.len() >= 3), :]
+
+    return df
+
+
+def _normalize_names(words: pd.Series) -> pd.Series:
+    """ Remove accents, non-letters and single letters from names
+
+    Each unique name is normalized once since the same names,
+    e.g., "Thanos", are typically mentioned thousands of times.
+    """
+    codes, uniques = pd.factorize(words)
+    normalized = pd.Series([unidecode(word) for word in uniques], dtype=object)
+    normalized = normalized.str.replace('[^A-z]', ' ', regex=True).str.strip()
+    normalized = normalized.str.replace(r"\b[a-zA-Z]\b", "", regex=True).str.strip()
+    return pd.Series(normalized.values[codes], index=words.index, dtype=object)
+
+
+def _aggregate_names(mentions: pd.DataFrame, sentences_per_movie: dict, titles: List[str],
+                     threshold: float = 0.9) -> dict:
+    """ Combine similar names and average the sentiment of each name of each movie
+
+    Parameters
+    ----------
+    mentions : pd.DataFrame
+        The normalized mentions of all movies, see _collect_mentions
+
+    sentences_per_movie : dict
+        Title (key) and the total number of sentences in the reviews of that movie (value)
+
+    titles : list of str
+        The movies to aggregate
+
+    threshold : float, default 0.9
+        Only mentions of which the sentiment probability exceeds the threshold are used
+
+    Returns
+    -------
+    processed_names : dict
+        Title (key) and dataframe of the names in that movie sorted by count (value)
+    """
+    columns = ["Word", "Sentiment", "Count", "Count_Percentage", "Title", "Nr_Words"]
+    df = mentions.loc[mentions.Prob > threshold, :]
+    if len(df) == 0:
+        return {title: pd.DataFrame(columns=columns) for title in titles}
+
+    # Similar names are only combined within a movie
+    df = pd.concat([_preprocess_titles(group) for _, group in df.groupby("Title", sort=False)])
 
     # Finishing up - Average all results and create a general overview of common persons
-    df = df.groupby("Word").agg({"Sentiment": [np.mean, np.count_nonzero]})
-    df.columns = df.columns.droplevel()
+    df = df.groupby(["Title", "Word"]).agg({"Sentiment": [np.mean, np.count_nonzero]})
+    df.columns = ["Sentiment", "Count"]
     df = df.reset_index()
-    df.columns = ["Word", "Sentiment", "Count"]
-    df["Count_Percentage"] = df.Count / nr_sentences * 100
-    df["Title"] = title
-    df = df.sort_values("Count", ascending=False)
-    df["Nr_Words"] = df.apply(lambda row: len(row.Word.split(" ")), 1)
+    df["Count_Percentage"] = df.Count / df.Title.map(sentences_per_movie) * 100
+    df["Nr_Words"] = df.Word.str.count(" ") + 1
+    df = df[columns]
 
-    return df
+    processed_names = {title: group.reset_index(drop=True).sort_values("Count", ascending=False)
+                       for title, group in df.groupby("Title", sort=False)}
+    return {title: processed_names.get(title, pd.DataFrame(columns=columns)) for title in titles}
 
 
 def _preprocess_titles(df: pd.DataFrame) -> pd.DataFrame:
@@ -288,20 +714,29 @@ def _preprocess_titles(df: pd.DataFrame) -> pd.DataFrame:
     # Extract frequency of words
     grouped = df.groupby("Word").count().reset_index().sort_values("Prob", ascending=False)
     count = list(zip(grouped.Word.values, grouped.Prob.values))
+    position = {word: index for index, (word, _) in enumerate(count)}
+    frequency = dict(count)
 
-    # From low frequent words to high frequent words, map low frequent words
-    # to higher frequent words if the edit distance is 2 or lower.
+    # Map each word to the most frequent word (the first in count) within an edit
+    # distance of 2 that is more frequent. Only words within that distance are compared.
+    index = EditDistanceIndex(word for word, _ in count)
     to_map = {}
-    for index, (search_word, search_count) in enumerate(count[::-1]):
-        for result_word, result_count in count[::-1][index + 1:]:
-            val = editdistance.eval(search_word, result_word)
-
-            if val != 0:
-                if val <= 2 and result_count > search_count:
-                    to_map[search_word] = result_word
+    for search_word, search_count in count:
+        candidates = [result_word for result_word, val in index.search(search_word)
+                      if val != 0 and frequency[result_word] > search_count]
+        if candidates:
+            to_map[search_word] = min(candidates, key=position.get)
+
+    # Follow chains of mappings, e.g., a word mapped to a word that is mapped itself
+    resolved = {}
+    for key in to_map:
+        value = to_map[key]
+        while value in to_map:
+            value = to_map[value]
+        resolved[key] = value
 
     # Apply the mapping
-    for key, value in to_map.items():
-        df.loc[df.Word == key, "Word"] = value
+    if resolved:
+        df = df.assign(Word=df.Word.map(resolved).fillna(df.Word))
 
     return df
@@ -1,18 +1,25 @@
 import os
 import re
 import json
+import time
+import threading
+from array import array
 import pandas as pd
 from tqdm import tqdm
 
 # Scraping
 import requests
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
 import scrapy
 from scrapy.crawler import CrawlerProcess
-from scrapy.selector import Selector
 from bs4 import BeautifulSoup
 from bs4.element import Tag
 
+from Reviewer.cache import ResponseCache
+from Reviewer.dedup import ReviewDeduplicator
+from Reviewer.utils import terminate_last_line
+
 
 class Scraper:
     """
@@ -27,21 +34,52 @@ class Scraper:
     prefix : str
         The prefix of the resulting saved files
 
+    cache_path : str, default None
+        The location of a ResponseCache that is shared by the spider and the
+        url search, e.g., data/cache.sqlite. If None, nothing is cached.
+
+    cache_ttl : float, default None
+        The number of seconds cached pages stay valid. If None, they never expire.
+
     """
-    def __init__(self, prefix: str, dir_path: str = ""):
+    def __init__(self, prefix: str, dir_path: str = "", cache_path: str = None, cache_ttl: float = None):
         self.dir_path = dir_path
         self.prefix = prefix + "_"
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+
+    def scrape(self, urls: list, resume: bool = False) -> None:
+        """ Scrape reviews from a list of urls (str) and saves them to data/
+
+        Every scraped page is recorded in data/{prefix}checkpoint.jsonl. After the crawl,
+        the reviews are streamed from the checkpoint to the JSON Lines feed
+        data/{prefix}reviews.jsonl, which is regrouped by parse_data.
+
+        If resume is True, the checkpoint of a previous crawl is used: completed titles are
+        skipped and other titles continue from their last pagination key. Otherwise, the
+        checkpoint of a previous crawl is removed and all urls are scraped again.
+        """
+        feed_path = f"{self.dir_path}data/{self.prefix}reviews.jsonl"
+        checkpoint_path = f"{self.dir_path}data/{self.prefix}checkpoint.jsonl"
+
+        if not resume and os.path.isfile(checkpoint_path):
+            os.remove(checkpoint_path)
 
-    def scrape(self, urls: list) -> None:
-        """ Scrape reviews from a list of urls (str) and saves them to data/ """
-        process = CrawlerProcess(settings={
-            "LOG_ENABLED": False,
-            "FEEDS": {
-                f"{self.dir_path}data/{self.prefix}reviews.json": {"format": "json"},
-            },
-        })
-        process.crawl(IMDBSpider, urls=urls)
+        checkpoint = ScrapeCheckpoint(checkpoint_path)
+        process = CrawlerProcess(settings={"LOG_ENABLED": False, **self._cache_settings()})
+        process.crawl(IMDBSpider, urls=urls, checkpoint=checkpoint)
         process.start()
+        checkpoint.export(feed_path, urls)
+
+    def _cache_settings(self) -> dict:
+        """ Scrapy settings that enable the CacheMiddleware if a cache_path was given """
+        if not self.cache_path:
+            return {}
+        return {
+            "DOWNLOADER_MIDDLEWARES": {"Reviewer.cache.CacheMiddleware": 900},
+            "REVIEWER_CACHE_PATH": self.cache_path,
+            "REVIEWER_CACHE_TTL": self.cache_ttl,
+        }
 
     def get_disney_urls(self) -> list:
         """ Scrape disney urls from wiki or load them from data/disney_urls.json """
@@ -57,21 +95,84 @@ class Scraper:
             disney_urls = list(disney_urls.values())
         return disney_urls
 
-    def parse_data(self):
-        """ Parse saved reviews to save them in a nicer format """
-        with open(f"{self.dir_path}data/{self.prefix}reviews.json", "r") as f:
-            docs = json.load(f)
+    def parse_data(self, deduplicate: bool = False) -> dict:
+        """ Parse saved reviews to save them in a nicer format
+
+        The JSON Lines feed is streamed twice. The first pass only keeps the byte offset
+        of each review per title, the second pass writes the reviews of one title at
+        a time. Memory therefore does not grow with the size of the reviews. The result
+        is written to a temporary file that replaces data/{prefix}reviews.json once it is
+        complete, such that neither the feed nor a previous result is lost on a crash.
+
+        Feeds of older versions, a json list in data/{prefix}reviews.json, are still supported.
+
+        Parameters
+        ----------
+        deduplicate : bool, default False
+            Whether to remove duplicate and near-duplicate reviews of each title
+            with a ReviewDeduplicator. The reviews of one title are then kept in memory.
+
+        Returns
+        -------
+        report : dict
+            The number of dropped duplicate reviews of each title
+        """
+        deduplicator = ReviewDeduplicator() if deduplicate else None
+        report = {}
+        feed_path = f"{self.dir_path}data/{self.prefix}reviews.jsonl"
+        save_path = f"{self.dir_path}data/{self.prefix}reviews.json"
+
+        if not os.path.isfile(feed_path):
+            with open(save_path, "r") as f:
+                docs = json.load(f)
+
+            if isinstance(docs, dict):
+                return report
+
+            feed_path = save_path + "l"
+            with open(feed_path, "w") as f:
+                for doc in docs:
+                    f.write(json.dumps(doc) + "\n")
+            del docs
+
+        # Index the offsets of the reviews of each title
+        offsets = {}
+        with open(feed_path, "rb") as f:
+            offset = f.tell()
+            for line in iter(f.readline, b""):
+                if line.strip():
+                    title = json.loads(line)["title"]
+                    offsets.setdefault(title, array("q")).append(offset)
+                offset = f.tell()
+
+        # Write the reviews title by title
+        temp_path = save_path + ".tmp"
+        with open(feed_path, "rb") as feed, open(temp_path, "w") as f:
+            f.write("{")
+            for index, (title, title_offsets) in enumerate(offsets.items()):
+                f.write(", " if index else "")
+                f.write(json.dumps(title) + ": [")
+                parsed_docs = (self._read_doc(feed, offset) for offset in title_offsets)
+                if deduplicator:
+                    parsed_docs, report[title] = deduplicator.deduplicate(list(parsed_docs))
+                for doc_index, parsed_doc in enumerate(parsed_docs):
+                    f.write(", " if doc_index else "")
+                    f.write(json.dumps(parsed_doc))
+                f.write("]")
+            f.write("}")
+            f.flush()
+            os.fsync(f.fileno())
 
-        titles = list(set([doc['title'] for doc in docs]))
-        new_docs = {title: [] for title in titles}
+        # Save newly parsed data
+        os.replace(temp_path, save_path)
 
-        for doc in docs:
-            parsed_doc = " ".join(doc["text"])
-            new_docs[doc['title']].append(parsed_doc)
+        return report
 
-        # Save newly parsed data
-        with open(f"{self.dir_path}data/{self.prefix}reviews.json", "w") as f:
-            json.dump(new_docs, f)
+    @staticmethod
+    def _read_doc(feed, offset: int) -> str:
+        """ Read the review at offset of the feed and join its text """
+        feed.seek(offset)
+        return " ".join(json.loads(feed.readline())["text"])
 
     @staticmethod
     def get_all_disney_titles() -> pd.DataFrame:
@@ -95,27 +196,62 @@ class Scraper:
 
         return disney
 
-    def scrape_disney_imdb_urls(self, df: pd.DataFrame, save: str = None) -> dict:
-        """ Scrape IMDB urls of all the movies """
-        titles = list(df.Film.values)
-        search_terms = (df.Film + "%20" + df.Year).values
-        urls = [None for _ in range(len(search_terms))]
+    def scrape_disney_imdb_urls(self, df: pd.DataFrame, save: str = None, n_jobs: int = 8,
+                                requests_per_second: float = 5, base_url: str = "https://www.imdb.com") -> dict:
+        """ Scrape IMDB urls of all the movies
+
+        The searches are done concurrently by n_jobs threads that share a pooled session.
+        Requests to a host are rate limited to requests_per_second and retried with
+        exponential backoff, the urls are returned in the order of df. If the search of a movie
+        still fails, a requests.RequestException that lists the failed movies is raised and
+        nothing is saved.
 
-        # Search for the movie and extract the first result
-        for index, search_term in tqdm(enumerate(search_terms), "Scraping IMDB urls"):
+        Parameters
+        ----------
+        df : pd.DataFrame
+            The films and years as created by get_all_disney_titles
 
-            # Get search result page
-            search_url = f"https://www.imdb.com/find?q={search_term}&s=tt&ttype=ft&ref_=fn_ft"
-            res = requests.get(search_url).text
-            soup = BeautifulSoup(res, 'lxml')
+        save : str, default None
+            Save the urls to data/{save}_urls.json
 
-            # Extract best search result
-            for result in soup.find_all("td", class_="result_text"):
-                if self.match_years(result, search_term):
-                    url = result.find_all("a", href=True)[0]["href"]
-                    url = f"https://www.imdb.com{url}reviews"
-                    urls[index] = url
-                    break
+        n_jobs : int, default 8
+            The number of concurrent searches
+
+        requests_per_second : float, default 5
+            The maximum number of requests per second per host
+
+        base_url : str, default "https://www.imdb.com"
+            The host to search, e.g., a local server with saved search pages
+        """
+        titles = list(df.Film.values)
+        search_terms = (df.Film + "%20" + df.Year).values
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=n_jobs)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        limiter = RateLimiter(requests_per_second)
+        cache = ResponseCache(self.cache_path, ttl=self.cache_ttl) if self.cache_path else None
+
+        failed = []
+
+        def resolve(title, search_term):
+            try:
+                return self.resolve_imdb_url(search_term, session, limiter, base_url, cache)
+            except requests.RequestException:
+                failed.append(title)
+
+        # Search for the movies and extract the first result, executor.map keeps the order
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            urls = list(tqdm(executor.map(resolve, titles, search_terms), "Scraping IMDB urls",
+                             total=len(search_terms)))
+        session.close()
+        if cache:
+            cache.close()
+
+        # Nothing is saved, such that a failed search is not replaced by a fallback url on later runs
+        if failed:
+            raise requests.RequestException(f"Searching IMDB failed after all retries for: {', '.join(failed)}")
 
         # Need to manually add saludos amigos as imdb's search engine cannot find it
         urls = {title: url if url else "https://www.imdb.com/title/tt0036326/reviews" for url, title in zip(urls, titles)}
@@ -130,6 +266,27 @@ class Scraper:
 
         return urls
 
+    def resolve_imdb_url(self, search_term: str, session: requests.Session, limiter: "RateLimiter",
+                         base_url: str = "https://www.imdb.com", cache: ResponseCache = None) -> str:
+        """ Search IMDB for a movie and return the review url of the first result that matches
+        its year, or None if there is no such result. Raises a requests.RequestException
+        if the search page could not be downloaded. """
+
+        # Get search result page
+        search_url = f"{base_url}/find?q={search_term}&s=tt&ttype=ft&ref_=fn_ft"
+        res = get_with_retries(session, search_url, limiter, cache=cache)
+        if res is None:
+            raise requests.RequestException(f"Could not download {search_url}")
+        soup = BeautifulSoup(res, 'lxml')
+
+        # Extract best search result
+        for result in soup.find_all("td", class_="result_text"):
+            if self.match_years(result, search_term):
+                url = result.find_all("a", href=True)[0]["href"]
+                return f"https://www.imdb.com{url}reviews"
+
+        return None
+
     @staticmethod
     def match_years(search_result: Tag, year: str) -> bool:
         """ Check if the year of a movie search matches (within 2 years) the year of the search result"""
@@ -147,6 +304,64 @@ class Scraper:
         return False
 
 
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces out the requests to each host
+
+    Parameters:
+    -----------
+    requests_per_second : float
+        The maximum number of requests per second per host
+    """
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url: str):
+        """ Block until a request to the host of url is allowed """
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def get_with_retries(session: requests.Session, url: str, limiter: RateLimiter = None,
+                     retries: int = 3, backoff: float = 1.0, cache: ResponseCache = None) -> str:
+    """ Get the text of url, retrying connection errors, 429 and 5xx responses
+    with exponential backoff. Returns None if all attempts fail.
+
+    If a cache is given, a cached page is returned without a request and
+    successfully downloaded pages are added to the cache.
+    """
+    if cache:
+        body = cache.get(url)
+        if body is not None:
+            return body.decode("utf-8")
+
+    for attempt in range(retries + 1):
+        if limiter:
+            limiter.wait(url)
+        try:
+            res = session.get(url, timeout=30)
+            if res.ok:
+                if cache:
+                    cache.set(url, res.content)
+                return res.text
+            if res.status_code != 429 and res.status_code < 500:
+                return None
+        except requests.RequestException:
+            pass
+
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+
+    return None
+
+
 class IMDBSpider(scrapy.Spider):
     """
     Scrapy Spider for extracting reviews from IMDB
@@ -155,14 +370,29 @@ class IMDBSpider(scrapy.Spider):
     """
     name = "imdb"
 
-    def __init__(self, urls, **kwargs):
+    def __init__(self, urls, checkpoint=None, **kwargs):
         self.start_urls = urls
+        self.checkpoint = checkpoint
         super().__init__(**kwargs)
 
     def start_requests(self):
-        """ Keeps track of the original url: Currently not used as title is extract from IMDB """
+        """ Keeps track of the original url: Currently not used as title is extract from IMDB
+
+        If a checkpoint is given, completed urls are skipped and partially scraped
+        urls continue from their last pagination key.
+        """
         for url in self.start_urls:
-            yield scrapy.Request(url, meta={'orig_url': url})
+            state = self.checkpoint.get(url) if self.checkpoint else None
+
+            if state is None:
+                yield scrapy.Request(url, meta={'orig_url': url})
+            elif not state["done"]:
+                yield scrapy.Request(self.next_url(url, state["key"]), meta={'orig_url': url, "title": state["title"]})
+
+    async def start(self):
+        """ Entry point of Scrapy >= 2.13, which no longer calls start_requests itself """
+        for request in self.start_requests():
+            yield request
 
     def parse(self, response):
         """ Extract reviews from IMDB and clicks on 'load more' to load more reviews """
@@ -175,18 +405,93 @@ class IMDBSpider(scrapy.Spider):
         except:
             title = response.meta['title']
 
-        for text in texts:
-            text = text.extract()
-            text = Selector(text=text)
-            text = text.xpath("//div[@class='text show-more__control']/text()").extract()
-            yield {
-                "title": title,
-                "text": text
-            }
+        # The text nodes are selected relative to each review div such that
+        # reviews do not have to be serialized and parsed again
+        items = [{"title": title, "text": text.xpath("./text()").getall()} for text in texts]
 
         key = response.css("div.load-more-data::attr(data-key)").get()
         orig_url = response.meta.get('orig_url', response.url)
-        next_url = urljoin(orig_url, "reviews/_ajax?paginationKey={}".format(key))
+
+        # Record the page before continuing such that a restart resumes from the next key
+        if self.checkpoint:
+            self.checkpoint.record(orig_url, title, [item["text"] for item in items], key)
+
+        yield from items
 
         if key:
-            yield scrapy.Request(next_url, meta={'orig_url': orig_url, "title": title})
+            yield scrapy.Request(self.next_url(orig_url, key), meta={'orig_url': orig_url, "title": title})
+
+    @staticmethod
+    def next_url(orig_url: str, key: str) -> str:
+        """ The url of the page that 'load more' would load """
+        return urljoin(orig_url, "reviews/_ajax?paginationKey={}".format(key))
+
+
+class ScrapeCheckpoint:
+    """
+    Append-only record of scraped IMDB pages such that a crawl can be resumed
+
+    Each line of the checkpoint file is a completed page of an original url with its title,
+    its reviews and the pagination key of the next page. A url is done when its last page
+    has no next key. Since a line is only written after its page was parsed, a crash
+    loses at most the page that was being scraped, and a partially written last line is ignored.
+
+    Only the title, last pagination key and state of each url are kept in memory,
+    the reviews are streamed from the checkpoint file when they are exported.
+
+    Parameters:
+    -----------
+    path : str
+        The location of the checkpoint file, e.g., data/disney_checkpoint.jsonl
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.states = {}
+
+        if os.path.isfile(path):
+            for page in self._pages():
+                self._apply(page)
+
+            terminate_last_line(path)
+
+    def get(self, url: str) -> dict:
+        """ The title, last pagination key and whether url is done, or None if never scraped """
+        return self.states.get(url)
+
+    def record(self, url: str, title: str, reviews: list, key: str = None):
+        """ Record a completed page of url, key is the pagination key of the next page """
+        page = {"url": url, "title": title, "reviews": reviews, "key": key}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(page) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply(page)
+
+    def export(self, path: str, urls: list = None):
+        """ Write all recorded reviews in the format of the scraped JSON Lines feed
+
+        The checkpoint file is streamed page by page, so the reviews are written
+        in the order in which they were scraped.
+        """
+        urls = set(urls) if urls else None
+
+        with open(path, "w") as f:
+            for page in self._pages():
+                if urls is None or page["url"] in urls:
+                    for text in page["reviews"]:
+                        f.write(json.dumps({"title": page["title"], "text": text}) + "\n")
+
+    def _pages(self):
+        """ Stream the recorded pages, skipping a partially written line """
+        if not os.path.isfile(self.path):
+            return
+
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def _apply(self, page: dict):
+        self.states[page["url"]] = {"title": page["title"], "key": page["key"], "done": not page["key"]}
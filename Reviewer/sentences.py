@@ -0,0 +1,153 @@
+import os
+import json
+import numpy as np
+from typing import Iterable, Iterator
+
+from nltk.tokenize import sent_tokenize
+from Reviewer.utils import MovieNotFoundError
+
+
+class SentenceIndex:
+    """
+    Persisted sentence segmentation of the reviews of all movies
+
+    The reviews are split into sentences once and only the character offsets of the
+    sentences are stored. Counting the sentences of a movie then only reads the index
+    and the sentences of a review are slices of the review itself, so the reviews are
+    never tokenized again.
+
+    The index is a directory with the following files:
+        * offsets.npy - (start, end) of each sentence within its review, int32
+        * reviews.npy - the position of the first sentence of each review in offsets, followed
+                        by the total number of sentences, int64
+        * lengths.npy - the number of characters of each review, int32
+        * titles.json - the reviews file that was indexed and, for each title,
+                        [first review, nr of reviews, nr of sentences]
+
+    Parameters:
+    -----------
+    path : str
+        The directory of the index, e.g., data/disney_reviews.sentences
+
+    Usage:
+    ------
+    index = SentenceIndex.open_or_build("data/disney_reviews.sentences", "data/disney_reviews.json", reviews)
+    index.count("Frozen")
+    sentences = list(index.sentences("Frozen", reviews["Frozen"]))
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(os.path.join(path, "titles.json")) as f:
+            meta = json.load(f)
+        self.source = meta["source"]
+        self.titles = meta["titles"]
+
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.reviews = np.load(os.path.join(path, "reviews.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(path, "lengths.npy"), mmap_mode="r")
+
+    def count(self, title: str) -> int:
+        """ The number of sentences in the reviews of a movie """
+        return self._title(title)[2]
+
+    def sentences(self, title: str, reviews: Iterable[str], start: int = 0) -> Iterator[str]:
+        """ Stream the sentences of the reviews of a movie
+
+        Parameters
+        ----------
+        title : str
+            The title of the movie
+
+        reviews : iterable of str
+            The reviews of the movie, or a slice of them starting at review `start`
+
+        start : int, default 0
+            The position of the first review of `reviews` among the reviews of the movie
+        """
+        first, nr_reviews, _ = self._title(title)
+        for review_index, review in enumerate(reviews, first + start):
+            if review_index >= first + nr_reviews or len(review) != self.lengths[review_index]:
+                raise ValueError(f"The sentence index {self.path} does not match the reviews of {title}, "
+                                 f"please rebuild it")
+
+            offsets = self.offsets[self.reviews[review_index]:self.reviews[review_index + 1]].tolist()
+            for sentence_start, sentence_end in offsets:
+                yield review[sentence_start:sentence_end]
+
+    def _title(self, title: str) -> list:
+        if title not in self.titles:
+            raise MovieNotFoundError(title, list(self.titles))
+        return self.titles[title]
+
+    @staticmethod
+    def build(path: str, reviews, source: str = None) -> "SentenceIndex":
+        """ Split the reviews of all movies into sentences and save their offsets
+
+        Parameters
+        ----------
+        path : str
+            The directory to save the index to
+
+        reviews : Mapping
+            Title (key) and reviews (value), e.g., a reviews json file or ReviewStore
+
+        source : str, default None
+            The path of the reviews, used by open_or_build to detect that they changed
+        """
+        os.makedirs(path, exist_ok=True)
+        titles_path = os.path.join(path, "titles.json")
+        if os.path.exists(titles_path):
+            os.remove(titles_path)
+
+        offsets, review_starts, lengths, titles = [], [], [], {}
+        for title in reviews:
+            first, nr_sentences = len(lengths), 0
+            for review in reviews[title]:
+                review_starts.append(len(offsets) // 2)
+                lengths.append(len(review))
+
+                position = 0
+                for sentence in sent_tokenize(review):
+                    position = review.find(sentence, position)
+                    offsets.extend((position, position + len(sentence)))
+                    position += len(sentence)
+                    nr_sentences += 1
+
+            titles[title] = [first, len(lengths) - first, nr_sentences]
+        review_starts.append(len(offsets) // 2)
+
+        np.save(os.path.join(path, "offsets.npy"), np.array(offsets, dtype=np.int32).reshape(-1, 2))
+        np.save(os.path.join(path, "reviews.npy"), np.array(review_starts, dtype=np.int64))
+        np.save(os.path.join(path, "lengths.npy"), np.array(lengths, dtype=np.int32))
+
+        # Written last, an index without titles.json is incomplete
+        with open(titles_path, "w") as f:
+            json.dump({"source": _fingerprint(source), "titles": titles}, f)
+
+        return SentenceIndex(path)
+
+    @staticmethod
+    def open_or_build(path: str, source: str, reviews) -> "SentenceIndex":
+        """ Open the index of the reviews in source, or build it if it is missing or the reviews changed """
+        if os.path.exists(os.path.join(path, "titles.json")):
+            index = SentenceIndex(path)
+            if index.source == _fingerprint(source) and set(index.titles) == set(reviews):
+                return index
+
+        return SentenceIndex.build(path, reviews, source)
+
+    @staticmethod
+    def default_path(reviews_path: str) -> str:
+        """ The index next to a reviews file or store, e.g., data/disney_reviews.sentences """
+        return os.path.splitext(reviews_path.rstrip("/"))[0] + ".sentences"
+
+
+def _fingerprint(path: str) -> list:
+    """ Size and modification time of a reviews json file or ReviewStore directory """
+    if path is None:
+        return None
+    if os.path.isdir(path):
+        path = os.path.join(path, "reviews.jsonl")
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
@@ -0,0 +1,122 @@
+import json
+import numpy as np
+import scipy.sparse as sp
+
+from Reviewer.utils import MovieNotFoundError
+
+
+class MovieSimilarity:
+    """
+    Find movies whose reviews sound alike based on their c-TF-IDF vectors
+
+    The similarity between two movies is the cosine similarity between their
+    (L2-normalized) c-TF-IDF score vectors. The vector of movie j in a SparseTFIDF
+    is matrix[:, j] + norm[j] * idf, so the dot product of two movies is:
+
+        x_j . x_k = S_j . S_k + norm[k] * (S_j . idf) + norm[j] * (S_k . idf) + norm[j] * norm[k] * (idf . idf)
+
+    Only S_j . S_k requires a sparse matrix product. It is computed for a block of
+    movies at a time such that the full movies x movies matrix is never created.
+
+    Parameters:
+    -----------
+    c_tf_idf : SparseTFIDF or np.ndarray
+        The (words x movies) c-TF-IDF scores
+
+    titles : list
+        The titles of the movies, in the order of the columns of c_tf_idf
+
+    block_size : int, default = 256
+        The number of movies for which similarities are computed at once
+
+    Usage:
+    ------
+    similarity = MovieSimilarity(c_tf_idf, titles)
+    similarity.most_similar("Frozen", k=5)
+    """
+    def __init__(self, c_tf_idf, titles: list, block_size: int = 256):
+        if isinstance(c_tf_idf, np.ndarray):
+            matrix = sp.csc_matrix(c_tf_idf)
+            idf = np.zeros(matrix.shape[0])
+            norm = np.zeros(matrix.shape[1])
+        else:
+            matrix, idf, norm = c_tf_idf.matrix, c_tf_idf.idf, c_tf_idf.norm
+
+        self.titles = list(titles)
+        self.title_index = {title: index for index, title in enumerate(self.titles)}
+        self.block_size = block_size
+
+        self.matrix = sp.csc_matrix(matrix, dtype=np.float64)
+        self.norm = np.asarray(norm, dtype=np.float64)
+        idf = np.asarray(idf, dtype=np.float64)
+
+        # Everything that is needed besides S_j . S_k
+        self.idf_dot = self.matrix.T @ idf
+        self.idf_sq = idf @ idf
+        sq_lengths = np.asarray(self.matrix.multiply(self.matrix).sum(axis=0)).ravel()
+        sq_lengths += 2 * self.norm * self.idf_dot + self.norm ** 2 * self.idf_sq
+        self.lengths = np.sqrt(np.maximum(sq_lengths, 0))
+        self.lengths[self.lengths == 0] = 1
+
+    def similarity(self, columns: np.ndarray) -> np.ndarray:
+        """ Cosine similarity between the movies in columns and all movies
+
+        Returns
+        -------
+        similarities : np.ndarray
+            A (len(columns) x movies) array
+        """
+        columns = np.asarray(columns)
+        dot = np.asarray((self.matrix[:, columns].T @ self.matrix).todense())
+        dot += np.outer(self.idf_dot[columns], self.norm)
+        dot += np.outer(self.norm[columns], self.idf_dot)
+        dot += np.outer(self.norm[columns], self.norm) * self.idf_sq
+        return dot / np.outer(self.lengths[columns], self.lengths)
+
+    def most_similar(self, movie: str, k: int = 10) -> list:
+        """ The k movies most similar to movie, excluding the movie itself """
+        return self.batch_most_similar([movie], k)[movie]
+
+    def batch_most_similar(self, movies: list, k: int = 10) -> dict:
+        """ The k movies most similar to each movie in movies
+
+        Returns
+        -------
+        neighbours : dict
+            Title (key) and a list of (title, similarity) tuples (value)
+        """
+        for movie in movies:
+            if movie not in self.title_index:
+                raise MovieNotFoundError(movie, self.titles)
+
+        columns = np.array([self.title_index[movie] for movie in movies], dtype=np.int64)
+        neighbours = {}
+        for start in range(0, len(columns), self.block_size):
+            block = columns[start:start + self.block_size]
+            indices, values = self._top_k(block, k)
+            for column, movie_indices, movie_values in zip(block, indices, values):
+                neighbours[self.titles[column]] = [(self.titles[index], float(value))
+                                                   for index, value in zip(movie_indices, movie_values)]
+        return neighbours
+
+    def neighbours(self, k: int = 10) -> dict:
+        """ The k most similar movies of every movie """
+        return self.batch_most_similar(self.titles, k)
+
+    def save_neighbours(self, path: str, k: int = 10):
+        """ Save the k most similar movies of every movie to a json file """
+        with open(path, 'w') as f:
+            json.dump(self.neighbours(k), f)
+
+    def _top_k(self, columns: np.ndarray, k: int) -> (np.ndarray, np.ndarray):
+        """ Select the k most similar movies of a block of movies """
+        similarities = self.similarity(columns)
+        similarities[np.arange(len(columns)), columns] = -np.inf
+        k = min(k, len(self.titles) - 1)
+        if k <= 0:
+            return np.zeros((len(columns), 0), dtype=np.int64), np.zeros((len(columns), 0))
+
+        indices = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        values = np.take_along_axis(similarities, indices, axis=1)
+        order = np.argsort(-values, axis=1, kind="stable")
+        return np.take_along_axis(indices, order, axis=1), np.take_along_axis(values, order, axis=1)
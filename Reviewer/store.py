@@ -0,0 +1,110 @@
+import os
+import json
+import mmap
+from collections.abc import Mapping
+
+
+class ReviewStore(Mapping):
+    """
+    Offset-indexed review store that loads the reviews of a movie lazily
+
+    A store is a directory with two files:
+        * reviews.jsonl - one review per line (as a json string), grouped by title
+        * index.json - title (key) and [start byte, end byte, nr of reviews] (value)
+
+    The reviews file is memory-mapped, so opening a store only reads the index and
+    reading the reviews of one movie only touches the bytes of that movie. The store
+    behaves like the dict of the *_reviews.json files: store[title] returns the list
+    of reviews of a movie, and it can be passed wherever those dicts are used.
+
+    Parameters:
+    -----------
+    path : str
+        The directory of the store, e.g., data/disney_reviews.store
+
+    Usage:
+    ------
+    To migrate an existing reviews file:
+
+    ReviewStore.convert("data/disney_reviews.json", "data/disney_reviews.store")
+    store = ReviewStore("data/disney_reviews.store")
+    reviews = store["Frozen"]
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+
+        self._file = open(os.path.join(path, "reviews.jsonl"), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __getitem__(self, title: str) -> list:
+        return list(self.iter_reviews(title))
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, title: str) -> bool:
+        return title in self.index
+
+    def count(self, title: str) -> int:
+        """ The number of reviews of a movie, without reading them """
+        return self.index[title][2]
+
+    def iter_reviews(self, title: str = None):
+        """ Stream the reviews of a movie or, if title is None, of all movies """
+        titles = [title] if title is not None else list(self.index)
+        for title in titles:
+            start, end, _ = self.index[title]
+            position = start
+            while position < end:
+                line_end = self._map.find(b"\n", position, end)
+                line_end = end if line_end == -1 else line_end
+                yield json.loads(self._map[position:line_end])
+                position = line_end + 1
+
+    def close(self):
+        if self._map:
+            self._map.close()
+        self._file.close()
+
+    @staticmethod
+    def write(path: str, reviews):
+        """ Create a store from a dict, or an iterable of (title, reviews) tuples """
+        os.makedirs(path, exist_ok=True)
+        items = reviews.items() if isinstance(reviews, Mapping) else reviews
+
+        index = {}
+        with open(os.path.join(path, "reviews.jsonl"), "wb") as f:
+            for title, docs in items:
+                start, count = f.tell(), 0
+                for doc in docs:
+                    f.write(json.dumps(doc).encode("utf-8") + b"\n")
+                    count += 1
+                index[title] = [start, f.tell(), count]
+
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump(index, f)
+
+    @staticmethod
+    def convert(json_path: str, store_path: str):
+        """ Migrate a *_reviews.json file to a store """
+        with open(json_path) as f:
+            reviews = json.load(f)
+        ReviewStore.write(store_path, reviews)
+
+
+def load_reviews(path: str) -> Mapping:
+    """ Load a reviews json file or open a ReviewStore directory
+
+    Both return a mapping of title (key) and list of reviews (value).
+    """
+    if os.path.isdir(path):
+        return ReviewStore(path)
+
+    with open(path) as f:
+        return json.load(f)
@@ -1,8 +1,16 @@
+import os
 import json
+import heapq
 import numpy as np
-import pandas as pd
+import scipy.sparse as sp
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.feature_extraction.text import CountVectorizer
 
+from Reviewer.index import TFIDFIndex
+from Reviewer.similarity import MovieSimilarity
+from Reviewer.store import ReviewStore, load_reviews
+
 
 class TFIDF:
     """
@@ -21,13 +29,14 @@ class TFIDF:
     def __init__(self, dir_path: str = ""):
         self.dir_path = dir_path
 
-    def generate(self, review_path: str, save_prefix: str, class_tfidf: bool = False, max_ngram: int = 1):
+    def generate(self, review_path: str, save_prefix: str, class_tfidf: bool = False, max_ngram: int = 1,
+                 n_jobs: int = None):
         """ Generate count or tf-idf data based on movie reviews and save them to a json file
 
         Parameters:
         -----------
         review_path : str
-            Location of the json reviews file
+            Location of the json reviews file or ReviewStore directory
 
         save_prefix : str
             The prefix of the file to be saved
@@ -38,35 +47,58 @@ class TFIDF:
         max_ngram : int, default = 1
             The highest number of ngrams to be used.
             Minimum is always 1.
+
+        n_jobs : int, default = None
+            The number of processes used to count the words of the movies
+            when using a class-based TF-IDF. If None, a single process is used.
         """
             
-        with open(self.dir_path+review_path) as f:
-            movie_reviews = json.load(f)
+        movie_reviews = load_reviews(self.dir_path+review_path)
 
         if class_tfidf:
-            titles, documents, m = self.prepare_data(movie_reviews)
-            c_tf_idf, count = self.c_tf_idf(documents, m, ngram_range=(1, max_ngram))
+            titles, c_tf_idf, count = self.fit_c_tf_idf(movie_reviews, ngram_range=(1, max_ngram), n_jobs=n_jobs)
             self.extract_top_n_tfidf(c_tf_idf, count, titles, n=2000, save=save_prefix)
-            # self.extract_top_n_relative_importance(tf_idf, count, titles, n=2000, save=save_prefix)
+            self.extract_top_n_relative_importance(c_tf_idf, count, titles, n=2000, save=save_prefix)
+            self.save_index(c_tf_idf, count, titles, save=save_prefix)
+            self.save_neighbours(c_tf_idf, titles, save=save_prefix)
         else:
             title = list(movie_reviews.keys())[0]
-            count = self.get_top_n_words(movie_reviews[title], n=2000)
+            if isinstance(movie_reviews, ReviewStore):
+                count = self.get_top_n_words(movie_reviews.iter_reviews(title), n=2000)
+            else:
+                count = self.get_top_n_words(movie_reviews[title], n=2000)
             count = {title: count}
             with open(f'{self.dir_path}data/{save_prefix}_count.json', 'w') as f:
                 json.dump(count, f)
 
-    def generate_disney(self):
+    def generate_disney(self, n_jobs: int = None):
         """ Load and generate c_tf_idf data for disney and pixar movies"""
         disney_reviews = self.load_disney_data()
 
         for reviews in [(disney_reviews, "disney")]:
-            titles, documents, m = self.prepare_data(reviews[0])
-            c_tf_idf, count = self.c_tf_idf(documents, m, ngram_range=(1, 3))
+            titles, c_tf_idf, count = self.fit_c_tf_idf(reviews[0], ngram_range=(1, 3), n_jobs=n_jobs)
             self.extract_top_n_tfidf(c_tf_idf, count, titles, n=2000, save=reviews[1])
-            # self.extract_top_n_relative_importance(tf_idf, count, titles, n=2000, save=reviews[1])
+            self.extract_top_n_relative_importance(c_tf_idf, count, titles, n=2000, save=reviews[1])
+            self.save_index(c_tf_idf, count, titles, save=reviews[1])
+            self.save_neighbours(c_tf_idf, titles, save=reviews[1])
+
+    def fit_c_tf_idf(self, reviews: dict, ngram_range=(1, 1), n_jobs: int = None) -> (list, "SparseTFIDF", object):
+        """ Calculate the sparse Class-based TF-IDF of all movies in reviews
+
+        If n_jobs is given, the words are counted in parallel and the model,
+        which offers get_feature_names(), is returned instead of the CountVectorizer.
+        """
+        if n_jobs:
+            model = IncrementalTFIDF(ngram_range=ngram_range)
+            model.update(reviews, n_jobs=n_jobs)
+            return model.titles, model.scores(), model
+
+        titles, documents, m = self.prepare_data(reviews)
+        c_tf_idf, count = self.c_tf_idf(documents, m, ngram_range=ngram_range, sparse=True)
+        return titles, c_tf_idf, count
 
     @staticmethod
-    def c_tf_idf(documents, m, ngram_range=(1, 1)):
+    def c_tf_idf(documents, m, ngram_range=(1, 1), sparse: bool = False, dtype=np.float32):
         """ Calculate Class-based TF-IDF
 
         The result is a single score for each word
@@ -76,10 +108,19 @@ class TFIDF:
         The documents is a list of two documents, where each document is a join of all 200 documents.
 
         m = total number of documents
+
+        sparse = whether to return a SparseTFIDF instead of a dense vocabulary x classes array.
+        Memory then scales with the number of non-zero counts, which matters for larger ngram ranges.
+
+        dtype = the storage type of the sparse scores, ignored when sparse is False
         """
 
         count = CountVectorizer(ngram_range=ngram_range, stop_words="english").fit(documents)
         t = count.transform(documents)
+
+        if sparse:
+            return TFIDF.sparse_c_tf_idf(t.T, m, dtype=dtype), count
+
         t = np.array(t.todense()).T
         w = t.sum(axis=0)
         tf = np.divide(t + 1, w + 1)
@@ -90,20 +131,173 @@ class TFIDF:
         return tf_idf, count
 
     @staticmethod
-    def get_top_n_words(corpus, n: int = 2000) -> list:
-        """ List the top n words in a vocabulary according to occurrence in a text corpus """
-        vec = CountVectorizer(stop_words="english").fit(corpus)
-        bag_of_words = vec.transform(corpus)
-        sum_words = bag_of_words.sum(axis=0)
-        words_freq = [(word, int(sum_words[0, idx])) for word, idx in vec.vocabulary_.items()]
-        words_freq = sorted(words_freq, key=lambda x: x[1], reverse=True)
-        return words_freq[:n]
+    def sparse_c_tf_idf(t, m, dtype=np.float32, w: np.ndarray = None, sum_tij: np.ndarray = None):
+        """ Calculate Class-based TF-IDF from a sparse (words x classes) count matrix
+
+        The totals are computed on the integer counts so that they stay exact,
+        only the resulting tf, idf and scores are stored as dtype. If the total
+        number of words per class (w) or per word (sum_tij) is already known, it
+        can be passed instead.
+        """
+        t = sp.csc_matrix(t)
+        w = np.asarray(t.sum(axis=0) if w is None else w, dtype=np.float64).ravel()
+        sum_tij = np.asarray(t.sum(axis=1) if sum_tij is None else sum_tij, dtype=np.float64).ravel()
+
+        norm = 1 / (w + 1)
+        idf = np.log(m / sum_tij)
+        tf = t.astype(dtype) @ sp.diags(norm.astype(dtype))
+        tf_idf = sp.diags(idf.astype(dtype)) @ tf
+
+        return SparseTFIDF(tf_idf, idf.astype(dtype), norm.astype(dtype))
+
+    @staticmethod
+    def parallel_count(reviews: dict, ngram_range=(1, 1), n_jobs: int = None,
+                       chunk_size: int = None) -> (list, sp.csc_matrix):
+        """ Count the words of each movie using a pool of processes
+
+        The reviews of each movie are split in chunks of chunk_size reviews (or a single
+        chunk per movie if chunk_size is None) that are handed out to the workers in two passes:
+            1. Each worker extracts the set of words of a chunk, these sets are merged into a
+               single sorted vocabulary, the same one a CountVectorizer would create
+            2. Each worker counts its chunks with a CountVectorizer that uses this fixed
+               vocabulary and only returns the word ids and counts, which are summed per movie
+        Only the words themselves, and no counts, are sent back in the first pass and
+        no words are sent back in the second, so merging the chunks does not sort any strings.
+
+        NOTE: Ngrams that span the last review of one chunk and the first review of the
+        next are not counted. Use chunk_size=None for counts identical to c_tf_idf.
+
+        Parameters
+        ----------
+        reviews : Mapping
+            Title (key) and list of reviews (value) of each movie, e.g., a dict or ReviewStore
+
+        ngram_range : tuple, default = (1, 1)
+            The lower and upper boundary of the ngrams to be extracted
+
+        n_jobs : int, default = None
+            The number of processes. If None, all cores are used.
+
+        chunk_size : int, default = None
+            The number of reviews that are counted per task
+
+        Returns
+        -------
+        terms, t : (list, sp.csc_matrix)
+            The vocabulary and the (words x movies) counts
+        """
+        titles = list(reviews.keys())
+        chunks, chunk_titles = [], []
+        for index, title in enumerate(titles):
+            # Read the reviews once, a ReviewStore decodes all reviews of a movie on each access
+            docs = list(reviews[title])
+            step = chunk_size if chunk_size else max(len(docs), 1)
+            for start in range(0, max(len(docs), 1), step):
+                chunks.append(docs[start:start + step])
+                chunk_titles.append(index)
+
+        # Vocabulary pass
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_count_worker,
+                                 initargs=(tuple(ngram_range),)) as executor:
+            terms = sorted(set().union(*executor.map(_chunk_vocabulary, chunks)))
+        if not terms:
+            return [], sp.csc_matrix((0, len(titles)), dtype=np.int64)
+
+        # Counting pass with the fixed vocabulary
+        vocabulary = {term: index for index, term in enumerate(terms)}
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_count_worker,
+                                 initargs=(tuple(ngram_range), vocabulary)) as executor:
+            counted = list(executor.map(_count_chunk, chunks))
+
+        sizes = [len(indices) for indices, _ in counted]
+        rows = np.concatenate([indices for indices, _ in counted])
+        cols = np.repeat(np.array(chunk_titles, dtype=np.int64), sizes)
+        counts = np.concatenate([chunk_counts for _, chunk_counts in counted])
+        t = sp.csc_matrix((counts, (rows, cols)), shape=(len(terms), len(titles)))
+        t.sum_duplicates()
+
+        return terms, t
+
+    @staticmethod
+    def get_top_n_words(corpus, n: int = 2000, max_words: int = None) -> list:
+        """ List the top n words in a vocabulary according to occurrence in a text corpus
+
+        The corpus is consumed in a single pass and can therefore be any iterable of reviews,
+        for example a generator that reads them from disk.
+
+        Parameters
+        ----------
+        corpus : iterable of str
+            The reviews of a single movie
+
+        n : int, default = 2000
+            The number of words to return
+
+        max_words : int, default = None
+            If None, all words are counted exactly. Otherwise, at most max_words words are kept
+            in memory and the counts of the top n words are approximated with Space-Saving.
+            The larger max_words compared to n, the more accurate the result.
+        """
+        analyzer = CountVectorizer(stop_words="english").build_analyzer()
+
+        if max_words:
+            counter = SpaceSaving(max(max_words, n))
+        else:
+            counter = Counter()
+
+        for doc in corpus:
+            counter.update(analyzer(doc))
+
+        return [(word, int(count)) for word, count in counter.most_common(n)]
+
+    def update(self, review_path: str, model_path: str, save_prefix: str, max_ngram: int = 1):
+        """ Add or update the movies in review_path to a saved c-TF-IDF model and
+        save the resulting tf-idf data without refitting all other movies
+
+        Parameters:
+        -----------
+        review_path : str
+            Location of the json reviews file or ReviewStore directory with the new or updated movies
+
+        model_path : str
+            Location of the IncrementalTFIDF model, ".npz" is added if it is missing. It is created
+            if it does not exist yet, unless tf-idf data was already saved with save_prefix.
+
+        save_prefix : str
+            The prefix of the file to be saved
+
+        max_ngram : int, default = 1
+            The highest number of ngrams to be used when a new model is created.
+        """
+        movie_reviews = load_reviews(self.dir_path+review_path)
+        model_path = IncrementalTFIDF.npz_path(self.dir_path+model_path)
+
+        if os.path.isfile(model_path):
+            model = IncrementalTFIDF.load(model_path)
+        elif os.path.isfile(f'{self.dir_path}data/{save_prefix}_tfidf.json'):
+            # A new model only knows the new movies and would overwrite the data of all others
+            raise FileNotFoundError(f"{model_path} does not exist, but data/{save_prefix}_tfidf.json does. "
+                                    f"Please pass the saved model or remove the data of {save_prefix}")
+        else:
+            model = IncrementalTFIDF(ngram_range=(1, max_ngram))
+
+        model.update(movie_reviews)
+        model.save(model_path)
+
+        c_tf_idf = model.scores()
+        self.extract_top_n_tfidf(c_tf_idf, model, model.titles, n=2000, save=save_prefix)
+        self.extract_top_n_relative_importance(c_tf_idf, model, model.titles, n=2000, save=save_prefix)
+        self.save_index(c_tf_idf, model, model.titles, save=save_prefix)
+        self.save_neighbours(c_tf_idf, model.titles, save=save_prefix)
 
     def load_disney_data(self) -> (dict, dict):
-        """ Load, for now, only Pixar reviews """
-        with open(f'{self.dir_path}data/disney_reviews.json') as f:
-            disney_reviews = json.load(f)
-        return disney_reviews
+        """ Load, for now, only Pixar reviews
+
+        If data/disney_reviews.store exists, the ReviewStore is used instead of the json file.
+        """
+        if os.path.isdir(f'{self.dir_path}data/disney_reviews.store'):
+            return ReviewStore(f'{self.dir_path}data/disney_reviews.store')
+        return load_reviews(f'{self.dir_path}data/disney_reviews.json')
 
     def prepare_data(self, reviews: dict) -> (list, list, int):
         """ Extract titles, documents and total number of documents (m)
@@ -120,29 +314,444 @@ class TFIDF:
 
     def extract_top_n_tfidf(self, tf_idf, count, titles, n: int = 200, save: str = False):
         """ Extract the top n words for each movie based on their tf-idf score """
-        result = pd.DataFrame(tf_idf, index=count.get_feature_names(), columns=titles)
-
-        top_n_words = {movie: None for movie in titles}
-        for movie in titles:
-            words = result[[movie]].sort_values(movie, ascending=False).index[:n]
-            values = result[[movie]].sort_values(movie, ascending=False).values[:n].flatten()
-            top_n_words[movie] = [(word, value) for word, value in zip(words, values)]
+        indices, values = self.top_n(tf_idf, n)
+        top_n_words = self._to_top_n_words(count, titles, indices, values)
 
         if save:
             with open(f'{self.dir_path}data/{save}_tfidf.json', 'w') as f:
                 json.dump(top_n_words, f)
 
     def extract_top_n_relative_importance(self, tf_idf, count, titles, n: int = 200, save: str = False):
-        """ Extract the top n words for each movie based on their relative tf-idf score """
-        result = pd.DataFrame(tf_idf, index=count.get_feature_names(), columns=titles)
+        """ Extract the top n words for each movie based on their relative tf-idf score
+
+        The relative importance of a word is its score in a movie divided by the sum
+        of its scores in all other movies. The total of each word is computed once such
+        that the sum of all other movies is simply that total minus the movie's own score.
+        """
+        if isinstance(tf_idf, SparseTFIDF):
+            indices, values = tf_idf.relative_top_n(n)
+        else:
+            tf_idf = np.asarray(tf_idf)
+            importance = tf_idf / (tf_idf.sum(axis=1, keepdims=True) - tf_idf)
+            indices, values = self.top_n(importance, n)
 
-        top_n_words = {movie: None for movie in titles}
-        for movie in titles:
-            result["Importance"] = result[movie].values / result.drop(movie, 1).reset_index(drop=True).sum(axis=1).values
-            words = result[["Importance"]].sort_values("Importance", ascending=False).index[:n]
-            values = result[["Importance"]].sort_values("Importance", ascending=False).values[:n].flatten()
-            top_n_words[movie] = [(word, value) for word, value in zip(words, values)]
+        top_n_words = self._to_top_n_words(count, titles, indices, values)
 
         if save:
             with open(f'{self.dir_path}data/{save}_tfidf_relative.json', 'w') as f:
                 json.dump(top_n_words, f)
+
+    def save_index(self, tf_idf, count, titles, save: str):
+        """ Save the full sparse scores as a memory-mapped index to data/{save}_index
+
+        See Reviewer.index.TFIDFIndex for querying the index.
+        """
+        TFIDFIndex.save(f'{self.dir_path}data/{save}_index', tf_idf, count.get_feature_names(), titles)
+
+    def save_neighbours(self, tf_idf, titles, save: str, k: int = 10):
+        """ Save the k most similar movies of each movie to data/{save}_neighbours.json """
+        MovieSimilarity(tf_idf, titles).save_neighbours(f'{self.dir_path}data/{save}_neighbours.json', k=k)
+
+    @staticmethod
+    def _to_top_n_words(count, titles, indices, values) -> dict:
+        """ Map the selected word indices and scores to (word, value) pairs per movie """
+        words = np.array(count.get_feature_names())
+        return {movie: [(word, float(value)) for word, value in zip(words[indices[index]], values[index])]
+                for index, movie in enumerate(titles)}
+
+    @staticmethod
+    def top_n(tf_idf, n: int = 200) -> (np.ndarray, np.ndarray):
+        """ Select the top n words of every class at once
+
+        Instead of sorting the full vocabulary for each class, argpartition
+        selects the n best words of all classes in one pass after which only
+        those n words are sorted.
+
+        Parameters
+        ----------
+        tf_idf : np.ndarray or SparseTFIDF
+            The (words x classes) c-TF-IDF scores
+
+        n : int, default = 200
+            The number of words to select per class
+
+        Returns
+        -------
+        indices, values : (np.ndarray, np.ndarray)
+            Two (classes x n) arrays with the word indices and their scores,
+            sorted from high to low for each class
+        """
+        if isinstance(tf_idf, SparseTFIDF):
+            return tf_idf.top_n(n)
+
+        tf_idf = np.asarray(tf_idf)
+        n = min(n, tf_idf.shape[0])
+        indices = np.argpartition(-tf_idf, n - 1, axis=0)[:n]
+        values = np.take_along_axis(tf_idf, indices, axis=0)
+        order = np.argsort(-values, axis=0, kind="stable")
+        indices = np.take_along_axis(indices, order, axis=0).T
+        values = np.take_along_axis(values, order, axis=0).T
+
+        return indices, values
+
+
+_count_vectorizer = None
+
+
+def _init_count_worker(ngram_range: tuple, vocabulary: dict = None):
+    """ Create the CountVectorizer of a worker of TFIDF.parallel_count once, with a fixed vocabulary if given """
+    global _count_vectorizer
+    _count_vectorizer = CountVectorizer(ngram_range=ngram_range, stop_words="english", vocabulary=vocabulary)
+
+
+def _chunk_vocabulary(reviews: list) -> list:
+    """ The words in a chunk of reviews, used by the vocabulary pass of TFIDF.parallel_count """
+    return list(set(_count_vectorizer.build_analyzer()(" ".join(reviews))))
+
+
+def _count_chunk(reviews: list) -> (np.ndarray, np.ndarray):
+    """ The word ids and counts of a chunk of reviews, used by the counting pass of TFIDF.parallel_count """
+    t = _count_vectorizer.transform([" ".join(reviews)])
+    return t.indices.astype(np.int64), t.data.astype(np.int64)
+
+
+class SparseTFIDF:
+    """
+    Class-based TF-IDF scores that are stored sparsely
+
+    Due to the add-one smoothing of the term frequency, every word gets a score
+    in every class, even if it never appears in that class:
+
+        tf_idf[i, j] = (t[i, j] + 1) / (w[j] + 1) * idf[i]
+
+    Instead of creating that dense words x classes array, the scores are split
+    into a sparse part that only holds the words that were counted in a class
+    and a smoothing part that is shared by all words:
+
+        tf_idf[i, j] = matrix[i, j] + idf[i] * norm[j]
+
+    where matrix = t / (w + 1) * idf and norm = 1 / (w + 1).
+
+    Parameters:
+    -----------
+    matrix : scipy.sparse.csc_matrix
+        The sparse (words x classes) part of the scores
+
+    idf : np.ndarray
+        The idf value of each word
+
+    norm : np.ndarray
+        The smoothing term 1 / (w + 1) of each class
+    """
+    def __init__(self, matrix, idf: np.ndarray, norm: np.ndarray):
+        self.matrix = sp.csc_matrix(matrix)
+        self.idf = idf
+        self.norm = norm
+
+    @property
+    def shape(self) -> (int, int):
+        return self.matrix.shape
+
+    @property
+    def dtype(self):
+        return self.matrix.dtype
+
+    def column(self, index: int) -> np.ndarray:
+        """ Dense scores of all words for a single class """
+        start, end = self.matrix.indptr[index], self.matrix.indptr[index + 1]
+        values = self.idf * self.norm[index]
+        values[self.matrix.indices[start:end]] += self.matrix.data[start:end]
+        return values
+
+    def top_n(self, n: int = 200) -> (np.ndarray, np.ndarray):
+        """ Select the top n words of every class without creating dense columns
+
+        A word that was not counted in a class scores idf * norm, so the best of those
+        words are simply the words with the highest idf. As long as those idf values are
+        positive, the top n of a class can only contain its counted words or one of the n
+        words with the highest idf. Only these candidates are scored and sorted.
+        """
+        nr_words, nr_classes = self.shape
+        n = min(n, nr_words)
+        highest_idf = np.argsort(-self.idf, kind="stable")[:n]
+
+        if self.idf[highest_idf[-1]] < 0:
+            columns = np.stack([self.column(index) for index in range(nr_classes)], axis=1)
+            return TFIDF.top_n(columns, n)
+
+        return self._select_top_n(n, highest_idf)
+
+    def relative_top_n(self, n: int = 200) -> (np.ndarray, np.ndarray):
+        """ Select the top n words of every class based on their relative importance
+
+        The importance of a word is its score divided by the sum of its scores in all other
+        classes, which is its row total minus its own score. Since idf cancels out, the
+        importance of a word that was not counted in a class is norm / (a - norm), where
+        a = row total / idf. The best of those words are therefore the words with the lowest a.
+        """
+        n = min(n, self.shape[0])
+        row_total = np.asarray(self.matrix.sum(axis=1)).ravel() + self.idf * self.norm.sum()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lowest_total = np.argsort(row_total / self.idf, kind="stable")[:n]
+
+        def relative_importance(rows, values):
+            return values / (row_total[rows] - values)
+
+        return self._select_top_n(n, lowest_total, relative_importance)
+
+    def _select_top_n(self, n: int, smooth_candidates: np.ndarray, transform=None) -> (np.ndarray, np.ndarray):
+        """ Select the top n of every class from all counted words and the n smooth candidates
+
+        Parameters
+        ----------
+        n : int
+            The number of words to select per class
+
+        smooth_candidates : np.ndarray
+            The n words that score best in a class in which they were not counted
+
+        transform : callable, default = None
+            Maps the (word indices, scores) of all candidates to the values to rank on
+        """
+        nr_words, nr_classes = self.shape
+
+        counted_cols = np.repeat(np.arange(nr_classes), np.diff(self.matrix.indptr))
+        counted_rows = self.matrix.indices
+        counted_keys = counted_cols.astype(np.int64) * nr_words + counted_rows
+        counted_values = self.matrix.data + self.idf[counted_rows] * self.norm[counted_cols]
+
+        smooth_cols = np.repeat(np.arange(nr_classes), n)
+        smooth_rows = np.tile(smooth_candidates, nr_classes)
+        smooth_keys = smooth_cols.astype(np.int64) * nr_words + smooth_rows
+        not_counted = ~np.isin(smooth_keys, counted_keys)
+        smooth_cols, smooth_rows = smooth_cols[not_counted], smooth_rows[not_counted]
+        smooth_values = self.idf[smooth_rows] * self.norm[smooth_cols]
+
+        cols = np.concatenate([counted_cols, smooth_cols])
+        rows = np.concatenate([counted_rows, smooth_rows])
+        values = np.concatenate([counted_values, smooth_values])
+        if transform:
+            values = transform(rows, values)
+
+        # Sort by class and score, then keep the first n candidates of each class
+        order = np.lexsort((rows, -values, cols))
+        cols, rows, values = cols[order], rows[order], values[order]
+        starts = np.searchsorted(cols, np.arange(nr_classes))
+        keep = (np.arange(len(cols)) - starts[cols]) < n
+
+        return rows[keep].reshape(nr_classes, n), values[keep].reshape(nr_classes, n)
+
+
+    def toarray(self) -> np.ndarray:
+        """ Dense (words x classes) array of all scores """
+        return self.matrix.toarray() + np.outer(self.idf, self.norm)
+
+
+class IncrementalTFIDF:
+    """
+    Class-based TF-IDF that can add new movies, or replace the reviews of
+    existing movies, without refitting the whole corpus.
+
+    The model only keeps the vocabulary, the word counts per movie, the total
+    number of words per movie (w), the total of each word across movies and
+    the number of reviews per movie from which m follows. When movies are
+    added, only their reviews are vectorized and merged into these counts.
+    The scores are recomputed lazily, the first time they are requested after
+    an update.
+
+    The model can be used in place of the fitted CountVectorizer in
+    TFIDF.extract_top_n_tfidf since it also offers get_feature_names().
+
+    Parameters:
+    -----------
+    ngram_range : tuple, default = (1, 1)
+        The lower and upper boundary of the ngrams to be extracted
+    """
+    def __init__(self, ngram_range=(1, 1)):
+        self.ngram_range = tuple(ngram_range)
+        self.terms = []
+        self.vocabulary = {}
+        self.titles = []
+        self.counts = sp.csc_matrix((0, 0), dtype=np.int64)
+        self.w = np.zeros(0, dtype=np.int64)
+        self.sum_tij = np.zeros(0, dtype=np.int64)
+        self.nr_docs = np.zeros(0, dtype=np.int64)
+        self._scores = None
+
+    @property
+    def m(self) -> int:
+        """ The total number of documents across all movies """
+        return int(self.nr_docs.sum())
+
+    def get_feature_names(self) -> list:
+        return self.terms
+
+    def update(self, reviews: dict, n_jobs: int = None, chunk_size: int = None):
+        """ Add new movies or replace the counts of movies that were already added
+
+        Parameters
+        ----------
+        reviews : dict
+            Title (key) and list of reviews (value) of each new or updated movie
+
+        n_jobs : int, default = None
+            If given, count the words with TFIDF.parallel_count using n_jobs processes
+
+        chunk_size : int, default = None
+            The number of reviews per task when counting in parallel
+        """
+        titles = list(reviews.keys())
+        if not titles:
+            return
+
+        if n_jobs:
+            new_terms, t = TFIDF.parallel_count(reviews, self.ngram_range, n_jobs=n_jobs, chunk_size=chunk_size)
+        else:
+            documents = [" ".join(reviews[title]) for title in titles]
+            count = CountVectorizer(ngram_range=self.ngram_range, stop_words="english").fit(documents)
+            t = count.transform(documents).T.tocsc()
+            new_terms = count.get_feature_names()
+
+        # Map the words of the new movies onto the (extended) vocabulary
+        word_index = np.empty(t.shape[0], dtype=np.int64)
+        for index, term in enumerate(new_terms):
+            if term not in self.vocabulary:
+                self.vocabulary[term] = len(self.terms)
+                self.terms.append(term)
+            word_index[index] = self.vocabulary[term]
+
+        nr_words, nr_titles = len(self.terms), len(self.titles)
+        t = sp.csc_matrix((t.data, word_index[t.indices], t.indptr), shape=(nr_words, len(titles)))
+        counts = sp.csc_matrix((self.counts.data, self.counts.indices, self.counts.indptr),
+                               shape=(nr_words, nr_titles))
+        sum_tij = np.zeros(nr_words, dtype=np.int64)
+        sum_tij[:len(self.sum_tij)] = self.sum_tij
+
+        # Replace the columns of updated movies and append those of new movies
+        title_index = {title: index for index, title in enumerate(self.titles)}
+        columns = list(range(nr_titles))
+        w = list(self.w)
+        nr_docs = list(self.nr_docs)
+        new_w = np.asarray(t.sum(axis=0)).ravel()
+        for index, title in enumerate(titles):
+            if title in title_index:
+                old = title_index[title]
+                sum_tij -= np.asarray(counts[:, old].sum(axis=1)).ravel()
+                columns[old] = nr_titles + index
+                w[old] = new_w[index]
+                nr_docs[old] = len(reviews[title])
+            else:
+                title_index[title] = len(columns)
+                columns.append(nr_titles + index)
+                self.titles.append(title)
+                w.append(new_w[index])
+                nr_docs.append(len(reviews[title]))
+        sum_tij += np.asarray(t.sum(axis=1)).ravel()
+
+        self.counts = sp.hstack([counts, t], format="csc")[:, columns]
+        self.w = np.array(w, dtype=np.int64)
+        self.sum_tij = sum_tij
+        self.nr_docs = np.array(nr_docs, dtype=np.int64)
+
+        # Words that only appeared in replaced reviews are no longer counted anywhere
+        if (self.sum_tij == 0).any():
+            self._prune()
+
+        self._scores = None
+
+    def scores(self, dtype=np.float32):
+        """ The (words x classes) c-TF-IDF scores as a SparseTFIDF """
+        if self._scores is None or self._scores.dtype != dtype:
+            self._scores = TFIDF.sparse_c_tf_idf(self.counts, self.m, dtype=dtype, w=self.w, sum_tij=self.sum_tij)
+        return self._scores
+
+    def save(self, path: str):
+        """ Save the state of the model to a .npz file, ".npz" is added to path if it is missing """
+        np.savez_compressed(self.npz_path(path),
+                            data=self.counts.data, indices=self.counts.indices, indptr=self.counts.indptr,
+                            shape=np.array(self.counts.shape), w=self.w, sum_tij=self.sum_tij,
+                            nr_docs=self.nr_docs, ngram_range=np.array(self.ngram_range),
+                            terms=np.array(self.terms, dtype=str), titles=np.array(self.titles, dtype=str))
+
+    @classmethod
+    def load(cls, path: str):
+        """ Load a model that was saved with IncrementalTFIDF.save """
+        with np.load(cls.npz_path(path), allow_pickle=False) as state:
+            model = cls(ngram_range=tuple(state["ngram_range"].tolist()))
+            model.counts = sp.csc_matrix((state["data"], state["indices"], state["indptr"]),
+                                         shape=tuple(state["shape"].tolist()))
+            model.w = state["w"]
+            model.sum_tij = state["sum_tij"]
+            model.nr_docs = state["nr_docs"]
+            model.terms = state["terms"].tolist()
+            model.titles = state["titles"].tolist()
+        model.vocabulary = {term: index for index, term in enumerate(model.terms)}
+        return model
+
+    @staticmethod
+    def npz_path(path: str) -> str:
+        """ The file that np.savez_compressed writes to, which always ends in .npz """
+        return path if path.endswith(".npz") else path + ".npz"
+
+    def _prune(self):
+        """ Remove words from the vocabulary that are not counted in any movie """
+        keep = self.sum_tij > 0
+        self.counts = self.counts[keep]
+        self.sum_tij = self.sum_tij[keep]
+        self.terms = [term for term, kept in zip(self.terms, keep) if kept]
+        self.vocabulary = {term: index for index, term in enumerate(self.terms)}
+
+
+class SpaceSaving:
+    """
+    Approximate word counter that keeps at most capacity words in memory
+
+    Implements the Space-Saving algorithm: if a new word arrives when the counter
+    is full, it replaces the word with the lowest count and inherits that count
+    plus one. Counts are therefore overestimated by at most the inherited count,
+    which is kept in self.errors, while frequent words are guaranteed to be kept.
+
+    Parameters:
+    -----------
+    capacity : int
+        The maximum number of words to keep track of
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self._heap = []
+
+    def update(self, words):
+        """ Count each word in an iterable of words """
+        for word in words:
+            if word in self.counts:
+                self.counts[word] += 1
+            elif len(self.counts) < self.capacity:
+                self.counts[word] = 1
+                self.errors[word] = 0
+            else:
+                minimum, victim = self._pop_minimum()
+                del self.counts[victim]
+                del self.errors[victim]
+                self.counts[word] = minimum + 1
+                self.errors[word] = minimum
+            heapq.heappush(self._heap, (self.counts[word], word))
+
+            # Remove outdated heap entries once they dominate the heap
+            if len(self._heap) > 4 * self.capacity:
+                self._heap = [(count, word) for word, count in self.counts.items()]
+                heapq.heapify(self._heap)
+
+    def most_common(self, n: int = None) -> list:
+        """ List the n words with the highest (estimated) count """
+        if n is None:
+            return sorted(self.counts.items(), key=lambda x: x[1], reverse=True)
+        return heapq.nlargest(n, self.counts.items(), key=lambda x: x[1])
+
+    def _pop_minimum(self) -> (int, str):
+        """ Pop the word with the lowest count, skipping heap entries of outdated counts """
+        while True:
+            count, word = heapq.heappop(self._heap)
+            if self.counts.get(word) == count:
+                return count, word
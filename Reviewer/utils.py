@@ -1,3 +1,6 @@
+import os
+
+
 class MovieNotFoundError(Exception):
     def __init__(self, input_movie, movies):
         self.input_movie = input_movie
@@ -8,3 +11,13 @@ class MovieNotFoundError(Exception):
         for movie in self.movies:
             message += f"\n * {movie}"
         return message
+
+
+def terminate_last_line(path: str):
+    """ Terminate a partially written last line of an append-only log such that new records start on their own line """
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
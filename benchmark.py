@@ -0,0 +1,349 @@
+"""
+Benchmarks of the pipeline
+
+Parser throughput on saved IMDB review and _ajax pages (*.html):
+    python benchmark.py parser --fixtures path/to/saved/pages
+
+Parser throughput on pages generated from already scraped reviews:
+    python benchmark.py parser --rpath avengers_reviews.json
+
+Character extraction, sentiment on all sentences (before) vs. only sentences with a person (after):
+    python benchmark.py character --rpath avengers_reviews.json --sample 200 --fast
+
+Recall and speed of the name pre-filter against the full tagger:
+    python benchmark.py prefilter --rpath disney_reviews.json --npath disney_names.json --sample 200 --fast
+
+Scaling of fuzzy name merging (_preprocess_titles) from thousands to hundreds of thousands of unique spans:
+    python benchmark.py names --npath avengers_names.json --sizes 1000 10000 100000 300000
+
+Scaling of parallel word counting (TFIDF.parallel_count) with the number of processes:
+    python benchmark.py count --rpath disney_reviews.json --max_ngram 3 --jobs 1 2 4 8
+
+"""
+import os
+import json
+import time
+import random
+import argparse
+import statistics
+from html import escape
+
+
+def parse_arguments() -> argparse.Namespace:
+    """ Parse command line inputs """
+    parser = argparse.ArgumentParser(description='Benchmark')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    parser_bench = subparsers.add_parser('parser', help='Reviews/sec of IMDBSpider.parse')
+    parser_bench.add_argument('--fixtures', help='Directory with saved IMDB review/_ajax pages (*.html)', default=None)
+    parser_bench.add_argument('--rpath', help='Reviews used to generate pages when no fixtures are given. Note:'
+                                              'This should be in the data folder', default="avengers_reviews.json")
+    parser_bench.add_argument('--repeat', help='Number of times each page is parsed', type=int, default=5)
+
+    character_bench = subparsers.add_parser('character', help='Runtime of Character.predict_single_movie')
+    character_bench.add_argument('--rpath', help='Path to review data. Note:'
+                                                 'This should be in the data folder', default="avengers_reviews.json")
+    character_bench.add_argument('--sample', help='Number of reviews of the first movie to use', type=int, default=200)
+    character_bench.add_argument('--fast', dest='fast', action='store_true', help='Use the cpu-based models')
+    character_bench.add_argument('--repeat', help='Number of timed runs of each path', type=int, default=3)
+
+    prefilter_bench = subparsers.add_parser('prefilter', help='Recall of NameFilter against the full tagger')
+    prefilter_bench.add_argument('--rpath', help='Path to review data. Note:'
+                                                 'This should be in the data folder', default="disney_reviews.json")
+    prefilter_bench.add_argument('--npath', help='Names files used as gazetteer. Note: These should be in the '
+                                                 'data folder', nargs='*', default=["disney_names.json"])
+    prefilter_bench.add_argument('--sample', help='Number of reviews of each movie to use', type=int, default=200)
+    prefilter_bench.add_argument('--min_tokens', help='Minimum number of words of a sentence', type=int, default=2)
+    prefilter_bench.add_argument('--fast', dest='fast', action='store_true', help='Use the cpu-based models')
+
+    names_bench = subparsers.add_parser('names', help='Runtime of merging similar names with _preprocess_titles')
+    names_bench.add_argument('--npath', help='Names file whose spans are perturbed into synthetic spans. Note:'
+                                             'This should be in the data folder', default="avengers_names.json")
+    names_bench.add_argument('--sizes', help='Numbers of unique spans', type=int, nargs='+',
+                             default=[1000, 10000, 100000])
+    names_bench.add_argument('--reference_max', help='Largest size on which the quadratic implementation is also '
+                                                     'run to check that the results are identical',
+                             type=int, default=5000)
+
+    count_bench = subparsers.add_parser('count', help='Runtime of TFIDF.parallel_count per number of processes')
+    count_bench.add_argument('--rpath', help='Path to review data. Note:'
+                                             'This should be in the data folder', default="disney_reviews.json")
+    count_bench.add_argument('--max_ngram', help='The highest number of ngrams', type=int, default=3)
+    count_bench.add_argument('--jobs', help='Numbers of processes', type=int, nargs='+', default=[1, 2, 4])
+    count_bench.add_argument('--chunk_size', help='Number of reviews per task', type=int, default=200)
+
+    args = parser.parse_args()
+    return args
+
+
+def generate_pages(reviews_path: str, reviews_per_page: int = 25) -> list:
+    """ Generate IMDB-like review pages from a reviews json file """
+    with open(reviews_path) as f:
+        reviews = json.load(f)
+
+    pages = []
+    for title, docs in reviews.items():
+        for start in range(0, len(docs), reviews_per_page):
+            divs = "".join(f"<div class='review-container'><div class='content'>"
+                           f"<div class='text show-more__control'>{escape(doc)}</div></div></div>"
+                           for doc in docs[start:start + reviews_per_page])
+            pages.append(f"<html><head><meta name='title' content='{escape(title)} (2000) - IMDb'></head>"
+                         f"<body>{divs}<div class='load-more-data' data-key='key{start}'></div></body></html>")
+    return pages
+
+
+def benchmark_parser(pages: list, repeat: int = 5) -> float:
+    """ Replay pages through IMDBSpider.parse and return the number of parsed reviews per second """
+    from scrapy.http import HtmlResponse, Request
+    from Reviewer.scraper import IMDBSpider
+
+    url = "https://www.imdb.com/title/tt0000000/reviews"
+    spider = IMDBSpider(urls=[url])
+    bodies = [page.encode("utf-8") if isinstance(page, str) else page for page in pages]
+
+    nr_reviews = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for body in bodies:
+            request = Request(url, meta={'orig_url': url, 'title': 'Unknown'})
+            response = HtmlResponse(url, body=body, encoding="utf-8", request=request)
+            nr_reviews += sum(1 for item in spider.parse(response) if isinstance(item, dict))
+    elapsed = time.perf_counter() - start
+
+    return nr_reviews / elapsed
+
+
+def benchmark_character(reviews: list, fast: bool = False, repeat: int = 3, tolerance: float = 1e-3) -> dict:
+    """ Time Character.predict_single_movie against running sentiment on every sentence
+
+    Both paths are run once on a few reviews before timing such that neither runs on cold
+    models, and their order alternates between repeats. The median of each is reported.
+    The results are identical if the names and labels are equal and the scores differ by
+    at most tolerance, since batches of other sentences can change the scores slightly.
+    """
+    from flair.data import Sentence
+    from nltk.tokenize import sent_tokenize
+    from Reviewer.names import Character
+
+    char = Character(fast=fast)
+
+    def before(docs):
+        # Sentiment on every sentence
+        sentences = [Sentence(sentence) for review in docs for sentence in sent_tokenize(review)]
+        char.tagger.predict(sentences, verbose=False)
+        char.classifier.predict(sentences, verbose=False)
+        return [(token.text, sentence.get_labels()[0].score, sentence.get_labels()[0].value)
+                for sentence in sentences for token in sentence.get_spans('ner') if token.tag == "PER"]
+
+    def after(docs):
+        return char.predict_single_movie(docs)
+
+    # Warm-up
+    before(reviews[:5])
+    after(reviews[:5])
+
+    timings, results = {"before": [], "after": []}, {}
+    for index in range(repeat):
+        order = [("before", before), ("after", after)]
+        for name, predict in (order if index % 2 == 0 else order[::-1]):
+            start = time.perf_counter()
+            results[name] = predict(reviews)
+            timings[name].append(time.perf_counter() - start)
+
+    report = {name: statistics.median(values) for name, values in timings.items()}
+    report["identical"] = len(results["before"]) == len(results["after"]) and all(
+        text_before == text_after and label_before == label_after and abs(score_before - score_after) <= tolerance
+        for (text_before, score_before, label_before), (text_after, score_after, label_after)
+        in zip(results["before"], results["after"]))
+    return report
+
+
+def benchmark_prefilter(reviews: list, gazetteer_paths: list, min_tokens: int = 2, fast: bool = False) -> dict:
+    """ Recall, skipped sentences and runtime of each NameFilter configuration against the full tagger """
+    from nltk.tokenize import sent_tokenize
+    from Reviewer.names import Character
+    from Reviewer.name_filter import NameFilter
+
+    texts = [sentence for review in reviews for sentence in sent_tokenize(review)]
+    char = Character(fast=fast)
+
+    start = time.perf_counter()
+    outputs = char._predict_sentences(texts)
+    report = {"tagger": {"seconds": time.perf_counter() - start}}
+
+    filters = {"capitalization": NameFilter(min_tokens=min_tokens)}
+    if gazetteer_paths:
+        filters["capitalization + gazetteer"] = NameFilter.from_names(gazetteer_paths, min_tokens=min_tokens)
+
+    for name, name_filter in filters.items():
+        report[name] = name_filter.recall(texts, outputs)
+        char.name_filter = name_filter
+        start = time.perf_counter()
+        char._predict_sentences(texts)
+        report[name]["seconds"] = time.perf_counter() - start
+
+    return report
+
+
+def generate_spans(names_path: str, size: int, seed: int = 42):
+    """ Generate a names dataframe with `size` unique spans from the spans in names_path
+
+    New spans are either a combination of one to three words of existing spans, e.g., a
+    first and last name, or a misspelling (one to three character edits) of an existing
+    span. The number of occurrences of each span follows a Zipf-like distribution.
+    """
+    import pandas as pd
+
+    with open(names_path) as f:
+        names = json.load(f)
+    base = sorted({name for results in names.values() for name, _, _ in results})
+    words = sorted({word for name in base for word in name.split()})
+
+    random_state = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    spans = base[:size]
+    unique = set(spans)
+    while len(spans) < size:
+        if random_state.random() < 0.7:
+            span = " ".join(random_state.choice(words) for _ in range(random_state.randint(1, 3)))
+        else:
+            span = list(random_state.choice(spans))
+            for _ in range(random_state.randint(1, 3)):
+                index = random_state.randrange(len(span) + 1)
+                edit = random_state.random()
+                if edit < 1 / 3 or not span[index:]:
+                    span.insert(index, random_state.choice(letters))
+                elif edit < 2 / 3:
+                    span[index] = random_state.choice(letters)
+                else:
+                    del span[index]
+            span = "".join(span)
+
+        if span not in unique:
+            unique.add(span)
+            spans.append(span)
+
+    occurrences = [span for rank, span in enumerate(spans, 1) for _ in range(max(1, 1000 // rank))]
+    random_state.shuffle(occurrences)
+    return pd.DataFrame({"Word": occurrences, "Prob": 1.0, "Sentiment": 1})
+
+
+def _preprocess_titles_quadratic(df):
+    """ The original implementation of _preprocess_titles that compares all pairs of words """
+    import editdistance
+
+    grouped = df.groupby("Word").count().reset_index().sort_values("Prob", ascending=False)
+    count = list(zip(grouped.Word.values, grouped.Prob.values))
+
+    to_map = {}
+    for index, (search_word, search_count) in enumerate(count[::-1]):
+        for result_word, result_count in count[::-1][index + 1:]:
+            val = editdistance.eval(search_word, result_word)
+
+            if val != 0:
+                if val <= 2 and result_count > search_count:
+                    to_map[search_word] = result_word
+
+    for key, value in to_map.items():
+        df.loc[df.Word == key, "Word"] = value
+
+    return df
+
+
+def benchmark_names(names_path: str, sizes: list, reference_max: int = 5000) -> list:
+    """ Time _preprocess_titles, and the quadratic implementation for sizes up to reference_max """
+    from Reviewer.names import _preprocess_titles
+
+    timings = []
+    for size in sizes:
+        df = generate_spans(names_path, size)
+        start = time.perf_counter()
+        result = _preprocess_titles(df.copy())
+        timing = {"size": size, "seconds": time.perf_counter() - start}
+
+        if size <= reference_max:
+            start = time.perf_counter()
+            reference = _preprocess_titles_quadratic(df.copy())
+            timing["reference_seconds"] = time.perf_counter() - start
+            timing["identical"] = reference.Word.tolist() == result.Word.tolist()
+
+        timings.append(timing)
+    return timings
+
+
+def benchmark_count(reviews: dict, max_ngram: int, jobs: list, chunk_size: int = 200) -> dict:
+    """ Time a single-process CountVectorizer against TFIDF.parallel_count with each number of processes """
+    from sklearn.feature_extraction.text import CountVectorizer
+    from Reviewer.tfidf import TFIDF
+
+    timings = {}
+    start = time.perf_counter()
+    documents = [" ".join(reviews[title]) for title in reviews]
+    CountVectorizer(ngram_range=(1, max_ngram), stop_words="english").fit_transform(documents)
+    timings["serial"] = time.perf_counter() - start
+
+    for n_jobs in jobs:
+        start = time.perf_counter()
+        TFIDF.parallel_count(reviews, (1, max_ngram), n_jobs=n_jobs, chunk_size=chunk_size)
+        timings[n_jobs] = time.perf_counter() - start
+
+    return timings
+
+
+def main():
+    args = parse_arguments()
+
+    if args.benchmark == "parser":
+        if args.fixtures:
+            pages = []
+            for file in sorted(os.listdir(args.fixtures)):
+                if file.endswith(".html"):
+                    with open(os.path.join(args.fixtures, file), "rb") as f:
+                        pages.append(f.read())
+        else:
+            pages = generate_pages("data/" + args.rpath)
+
+        reviews_per_second = benchmark_parser(pages, repeat=args.repeat)
+        print(f"Parsed {len(pages)} pages {args.repeat} times: {reviews_per_second:.0f} reviews/sec")
+
+    elif args.benchmark == "character":
+        with open("data/" + args.rpath) as f:
+            reviews = json.load(f)
+        reviews = reviews[list(reviews.keys())[0]][:args.sample]
+
+        timings = benchmark_character(reviews, fast=args.fast, repeat=args.repeat)
+        print(f"{len(reviews)} reviews, median of {args.repeat} runs - before: {timings['before']:.1f}s, "
+              f"after: {timings['after']:.1f}s, speedup: {timings['before'] / timings['after']:.2f}x, "
+              f"identical results: {timings['identical']}")
+
+    elif args.benchmark == "names":
+        for timing in benchmark_names("data/" + args.npath, args.sizes, args.reference_max):
+            line = f"{timing['size']} unique spans: {timing['seconds']:.1f}s"
+            if "reference_seconds" in timing:
+                line += f", quadratic: {timing['reference_seconds']:.1f}s, identical: {timing['identical']}"
+            print(line)
+
+    elif args.benchmark == "count":
+        with open("data/" + args.rpath) as f:
+            reviews = json.load(f)
+
+        timings = benchmark_count(reviews, args.max_ngram, args.jobs, args.chunk_size)
+        print(f"{os.cpu_count()} cores - serial CountVectorizer: {timings.pop('serial'):.1f}s")
+        for n_jobs, seconds in timings.items():
+            print(f"parallel_count with {n_jobs} processes: {seconds:.1f}s")
+
+    elif args.benchmark == "prefilter":
+        with open("data/" + args.rpath) as f:
+            reviews = json.load(f)
+        reviews = [review for docs in reviews.values() for review in docs[:args.sample]]
+
+        report = benchmark_prefilter(reviews, ["data/" + path for path in args.npath],
+                                     min_tokens=args.min_tokens, fast=args.fast)
+        print(f"{len(reviews)} reviews - full tagger: {report.pop('tagger')['seconds']:.1f}s")
+        for name, result in report.items():
+            print(f"{name}: recall {result['recall']:.3f}, sentence recall {result['sentence_recall']:.3f}, "
+                  f"skipped {result['skipped']:.1%} of sentences, {result['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
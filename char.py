@@ -4,6 +4,15 @@ Create Character Popularity Visualization
 Full Example:
     python char.py --movie Frozen --extract True --fast True --prefix disney --rpath disney_reviews.json --actors False
 
+Extract with 8 worker processes:
+    python char.py --movie Frozen --extract True --fast True --prefix disney --rpath disney_reviews.json --jobs 8
+
+Extract and skip sentences that cannot contain a name:
+    python char.py --movie Frozen --extract True --prefix disney --rpath disney_reviews.json --prefilter --gazetteer disney_names.json
+
+Resume an extraction that was interrupted:
+    python char.py --movie Frozen --extract True --prefix disney --rpath disney_reviews.json --resume
+
 Visualization only:
     python char.py --movie Frozen --prefix disney --rpath disney_reviews.json --npath disney_names.json --actors False
 
@@ -11,6 +20,8 @@ Visualization only:
 
 import argparse
 from Reviewer.names import Character
+from Reviewer.inference_cache import InferenceCache
+from Reviewer.name_filter import NameFilter
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -24,10 +35,22 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument('--prefix', help='Prefix for saving files', required=True)
     parser.add_argument('--rpath', help='Path to review data. E.g., disney_reviews.json. Note:'
                                         'This should be in the data folder', type=str, required=True)
-    parser.add_argument('--npath', help='Path to names data. E.g., disney_names.json. Note:'
+    parser.add_argument('--npath', help='Path to names data. E.g., disney_names.json or disney_names.mentions. Note:'
                                         'This should be in the data folder', type=str)
     parser.add_argument('--actors', help='Whether to only select names of two words which should '
                                          'represent people with the exception of characters with 2 names', default=False)
+    parser.add_argument('--cache', help='Path to a sentence prediction cache, e.g., data/inference.sqlite, such '
+                                        'that only new sentences are passed to the models', default=None)
+    parser.add_argument('--prefilter', dest='prefilter', action='store_true',
+                        help='Skip sentences that cannot contain a name instead of passing them to the tagger')
+    parser.add_argument('--gazetteer', help='Names files used by --prefilter to also keep sentences with known names, '
+                                            'e.g., disney_names.json or disney_names.mentions. '
+                                            'Note: These should be in the data folder',
+                        nargs='*', default=None)
+    parser.add_argument('--resume', dest='resume', action='store_true',
+                        help='Skip movies that were already extracted by a previous, interrupted run')
+    parser.add_argument('--jobs', help='Number of worker processes used when extracting names', type=int,
+                        default=None)
     args = parser.parse_args()
 
     return args
@@ -38,9 +61,16 @@ def main():
 
     # Extract names + sentiment
     if args.extract:
-        char = Character(dir_path="", fast=args.fast)
-        char.predict(path="data/"+args.rpath, prefix=args.prefix)
-        args.npath = args.prefix + "_names.json"
+        cache = InferenceCache(args.cache) if args.cache else None
+        name_filter = None
+        if args.prefilter:
+            name_filter = NameFilter.from_names(["data/" + path for path in args.gazetteer or []])
+        char = Character(dir_path="", fast=args.fast, load_classifiers=not args.jobs, cache=cache,
+                         name_filter=name_filter)
+        char.predict(path="data/"+args.rpath, prefix=args.prefix, n_jobs=args.jobs, resume=args.resume)
+        if cache:
+            print(cache.stats())
+        args.npath = args.prefix + "_names.mentions"
 
     # Visualize results
     char = Character(dir_path="", load_classifiers=False)
@@ -7,6 +7,8 @@ Examples:
     python scraper.py --prefix car --url https://www.imdb.com/title/tt1216475/reviews?ref_=tt_ov_rt --ngram 3
 * To scrape all disney movies:
     python scraper.py --disney --ngram 3
+* To continue a scrape that was interrupted:
+    python scraper.py --disney --ngram 3 --resume
 
 """
 import json
@@ -24,6 +26,13 @@ def parse_arguments():
     parser.add_argument('--url', help='Url', default=False)
     parser.add_argument('--disney', dest='disney', action='store_true', help="Choose all disney movies")
     parser.add_argument('--ngram', help='Max ngram', default=2)
+    parser.add_argument('--cache', help='Path to a page cache, e.g., data/cache.sqlite, such that '
+                                        'pages are only downloaded once', default=None)
+    parser.add_argument('--cache_ttl', help='Seconds cached pages stay valid', type=float, default=None)
+    parser.add_argument('--dedup', dest='dedup', action='store_true',
+                        help="Remove duplicate and near-duplicate reviews of each movie")
+    parser.add_argument('--resume', dest='resume', action='store_true',
+                        help="Resume an interrupted scrape from data/<prefix>_checkpoint.jsonl")
 
     args = parser.parse_args()
     return args
@@ -31,7 +40,7 @@ def parse_arguments():
 
 def main():
     args = parse_arguments()
-    sc = Scraper(dir_path=args.path, prefix=args.prefix)
+    sc = Scraper(dir_path=args.path, prefix=args.prefix, cache_path=args.cache, cache_ttl=args.cache_ttl)
 
     # Extract url
     if args.disney:
@@ -43,8 +52,11 @@ def main():
             urls = json.load(f)
 
     # Scrape data
-    sc.scrape(urls)
-    sc.parse_data()
+    sc.scrape(urls, resume=args.resume)
+    dropped = sc.parse_data(deduplicate=args.dedup)
+    if args.dedup:
+        for title, nr_dropped in dropped.items():
+            print(f"{title}: dropped {nr_dropped} duplicate reviews")
 
     # Apply TF-IDF
     tf = TFIDF(dir_path=args.path)